@@ -2,8 +2,9 @@ from .text_load import NODE_CLASS_MAPPINGS as TEXT_LOAD_MAPPINGS, NODE_DISPLAY_N
 from .custom_image_saver import NODE_CLASS_MAPPINGS as IMAGE_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as IMAGE_DISPLAY_MAPPINGS
 from .text_saver import NODE_CLASS_MAPPINGS as TEXT_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as TEXT_DISPLAY_MAPPINGS
 from .image_loader import NODE_CLASS_MAPPINGS as LOADER_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as LOADER_DISPLAY_MAPPINGS
+from .paired_dataset import NODE_CLASS_MAPPINGS as PAIRED_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as PAIRED_DISPLAY_MAPPINGS
 
-NODE_CLASS_MAPPINGS = {**TEXT_LOAD_MAPPINGS, **IMAGE_MAPPINGS, **TEXT_MAPPINGS, **LOADER_MAPPINGS}
-NODE_DISPLAY_NAME_MAPPINGS = {**TEXT_LOAD_DISPLAY_MAPPINGS, **IMAGE_DISPLAY_MAPPINGS, **TEXT_DISPLAY_MAPPINGS, **LOADER_DISPLAY_MAPPINGS}
+NODE_CLASS_MAPPINGS = {**TEXT_LOAD_MAPPINGS, **IMAGE_MAPPINGS, **TEXT_MAPPINGS, **LOADER_MAPPINGS, **PAIRED_MAPPINGS}
+NODE_DISPLAY_NAME_MAPPINGS = {**TEXT_LOAD_DISPLAY_MAPPINGS, **IMAGE_DISPLAY_MAPPINGS, **TEXT_DISPLAY_MAPPINGS, **LOADER_DISPLAY_MAPPINGS, **PAIRED_DISPLAY_MAPPINGS}
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Compare the old np.array -> astype(float32) -> / 255.0 conversion with
+image_decode.image_to_tensor on 4K images.
+
+Run from the repository root:
+
+    python benchmarks/decode_to_tensor.py [--width 3840] [--height 2160] [--repeat 10]
+
+Peak memory is measured with tracemalloc, which sees numpy and PIL buffers.
+image_to_tensor allocates its output with torch, which tracemalloc does not
+see, so the output tensor's size is added to its peak.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_decode import image_to_tensor  # noqa: E402
+
+
+def legacy_to_tensor(img):
+    if img.mode == 'RGBA':
+        img_array = np.array(img).astype(np.float32) / 255.0
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+        img_array = np.array(img).astype(np.float32) / 255.0
+    else:
+        img_array = np.array(img).astype(np.float32) / 255.0
+    return torch.from_numpy(img_array)[None,]
+
+
+def new_to_tensor(img):
+    return image_to_tensor(img)
+
+
+def make_images(width, height):
+    rng = np.random.default_rng(0)
+    rgb = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), "RGB")
+    return {
+        "RGB": rgb,
+        "RGBA": Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8), "RGBA"),
+        "L": rgb.convert("L"),
+        "P": rgb.convert("P"),
+    }
+
+
+def measure(convert, img, repeat, untraced_output=False):
+    convert(img)  # warm up
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = convert(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if untraced_output:
+        peak += result.element_size() * result.nelement()
+    del result
+    start = time.perf_counter()
+    for _ in range(repeat):
+        convert(img)
+    return (time.perf_counter() - start) / repeat, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.width}x{args.height}, {args.repeat} runs each")
+    print(f"{'mode':<6}{'legacy ms':>12}{'new ms':>10}{'legacy peak MB':>17}{'new peak MB':>14}")
+    for mode, img in make_images(args.width, args.height).items():
+        legacy_time, legacy_peak = measure(legacy_to_tensor, img, args.repeat)
+        new_time, new_peak = measure(new_to_tensor, img, args.repeat, untraced_output=True)
+        # The new path must produce bit-identical tensors
+        assert torch.equal(legacy_to_tensor(img), new_to_tensor(img)), mode
+        print(f"{mode:<6}{legacy_time * 1000:>12.1f}{new_time * 1000:>10.1f}"
+              f"{legacy_peak / 2**20:>17.1f}{new_peak / 2**20:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import bisect
+import lzma
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    from compression import zstd as stdlib_zstd  # Python 3.14+
+except ImportError:
+    stdlib_zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+READ_SIZE = 64 * 1024
+# Decompressed bytes between in-memory zlib snapshots of a gzip stream
+CHECKPOINT_SPACING = 4 * 1024 * 1024
+# Number of compressed files whose snapshots are kept in memory
+MAX_CHECKPOINTED_FILES = 32
+
+
+def detect_compression(file_path):
+    """Return "gzip", "xz" or "zstd" based on the file's magic bytes, or None."""
+    with open(file_path, 'rb') as f:
+        head = f.read(len(XZ_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(XZ_MAGIC):
+        return "xz"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def new_decompressor(compression):
+    if compression == "gzip":
+        return zlib.decompressobj(wbits=31)
+    if compression == "xz":
+        return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+    if compression == "zstd":
+        if stdlib_zstd is not None:
+            return stdlib_zstd.ZstdDecompressor()
+        if zstandard is not None:
+            return zstandard.ZstdDecompressor().decompressobj()
+        raise ImportError("Reading zstd-compressed files requires the 'zstandard' package")
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+class DecompressedStream:
+    """
+    Binary reader over the decompressed contents of a gzip/xz/zstd file.
+
+    Reading can start at a checkpoint (decompressed_offset, compressed_offset,
+    snapshot). A snapshot of None means a fresh decompressor, which is valid at
+    the start of every gzip member, xz stream and zstd frame; gzip additionally
+    gets zlib state snapshots every CHECKPOINT_SPACING bytes when recording.
+    """
+
+    def __init__(self, file_path, compression, checkpoint=(0, 0, None), record=False):
+        produced, compressed_offset, snapshot = checkpoint
+        self.compression = compression
+        self.checkpoints = [checkpoint] if record else None
+        self._file = open(file_path, 'rb')
+        self._file.seek(compressed_offset)
+        self._compressed_offset = compressed_offset
+        self._produced = produced
+        self._decompressor = snapshot.copy() if snapshot is not None else None
+        self._next_snapshot = produced + CHECKPOINT_SPACING
+        self._pending = bytearray()
+        self._eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._pending) < size):
+            self._fill()
+        if size < 0 or size >= len(self._pending):
+            data = bytes(self._pending)
+            self._pending.clear()
+        else:
+            data = bytes(self._pending[:size])
+            del self._pending[:size]
+        return data
+
+    def skip(self, size):
+        while size > 0:
+            data = self.read(min(size, READ_SIZE * 16))
+            if not data:
+                break
+            size -= len(data)
+
+    def _fill(self):
+        data = self._file.read(READ_SIZE)
+        if not data:
+            if self._decompressor is not None:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+            self._eof = True
+            return
+        chunk_end = self._compressed_offset + len(data)
+        while data:
+            if self._decompressor is None:
+                # Zero padding is allowed between gzip members and xz streams
+                data = data.lstrip(b'\0')
+                if not data:
+                    break
+                self._decompressor = new_decompressor(self.compression)
+                if self.checkpoints is not None and self._produced > self.checkpoints[-1][0]:
+                    self.checkpoints.append((self._produced, chunk_end - len(data), None))
+            out = self._decompressor.decompress(data)
+            self._pending += out
+            self._produced += len(out)
+            if not getattr(self._decompressor, 'eof', False):
+                break
+            data = self._decompressor.unused_data
+            self._decompressor = None
+        self._compressed_offset = chunk_end
+
+        if self.checkpoints is not None and self.compression == "gzip" \
+                and self._decompressor is not None and self._produced >= self._next_snapshot:
+            # zlib has consumed the whole chunk, so its state resumes at chunk_end
+            self.checkpoints.append((self._produced, chunk_end, self._decompressor.copy()))
+            self._next_snapshot = self._produced + CHECKPOINT_SPACING
+
+
+_checkpoint_lock = threading.Lock()
+_checkpoints = OrderedDict()
+
+
+def remember_checkpoints(signature, checkpoints):
+    with _checkpoint_lock:
+        _checkpoints[signature] = checkpoints
+        _checkpoints.move_to_end(signature)
+        while len(_checkpoints) > MAX_CHECKPOINTED_FILES:
+            _checkpoints.popitem(last=False)
+
+
+def get_checkpoints(file_path, compression, signature, restart_points):
+    """
+    Checkpoints for random access. gzip snapshots only live in memory, so after
+    a restart one full decompression pass recreates them; xz and zstd fall back
+    to the stream/frame boundaries persisted in the offset index.
+    """
+    with _checkpoint_lock:
+        checkpoints = _checkpoints.get(signature)
+        if checkpoints is not None:
+            _checkpoints.move_to_end(signature)
+            return checkpoints
+    if compression != "gzip":
+        return [(0, 0, None)] + [(d, c, None) for d, c in restart_points if d > 0]
+    with DecompressedStream(file_path, compression, record=True) as stream:
+        while stream.read(READ_SIZE * 16):
+            pass
+        checkpoints = stream.checkpoints
+    remember_checkpoints(signature, checkpoints)
+    return checkpoints
+
+
+def read_ranges(file_path, compression, signature, restart_points, spans):
+    """Decompress only what is needed to return buf[start:end] for each span."""
+    checkpoints = get_checkpoints(file_path, compression, signature, restart_points)
+    offsets = [cp[0] for cp in checkpoints]
+    results = {}
+    stream = None
+    position = 0
+    try:
+        for start, end in sorted(set(spans)):
+            checkpoint = checkpoints[bisect.bisect_right(offsets, start) - 1]
+            # Keep reading forward when no closer checkpoint lies ahead
+            if stream is None or position > start or checkpoint[0] > position:
+                if stream is not None:
+                    stream.close()
+                stream = DecompressedStream(file_path, compression, checkpoint)
+                position = checkpoint[0]
+            stream.skip(start - position)
+            results[(start, end)] = stream.read(end - start)
+            position = end
+    finally:
+        if stream is not None:
+            stream.close()
+    return [results[span] for span in spans]
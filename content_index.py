@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+from .offset_index import CACHE_DIR
+
+CONTENT_INDEX_DB_PATH = os.path.join(CACHE_DIR, "content_index.sqlite")
+
+
+class ContentIndex:
+    """
+    Persistent map from (output directory, pixel hash, format) to the file that
+    already holds those pixels, used by BatchImageSaver's dedup mode. Each entry
+    also records the file's mtime and size when it was written; a file that has
+    since been deleted, rewritten or overwritten by another save no longer
+    matches and its entry is dropped on lookup.
+    """
+
+    def __init__(self, db_path=CONTENT_INDEX_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS content (
+                directory TEXT,
+                hash TEXT,
+                extension TEXT,
+                path TEXT,
+                mtime_ns INTEGER,
+                size INTEGER,
+                PRIMARY KEY (directory, hash, extension)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS content_path ON content (path)")
+        return closing(conn)
+
+    def lookup(self, directory, extension, hashes):
+        """{hash: existing path} for the hashes already stored, unchanged, in directory."""
+        directory = os.path.abspath(directory)
+        found = {}
+        stale = []
+        with self._lock, self.connect() as conn:
+            for digest in set(hashes):
+                row = conn.execute("SELECT path, mtime_ns, size FROM content "
+                                   "WHERE directory = ? AND hash = ? AND extension = ?",
+                                   (directory, digest, extension)).fetchone()
+                if row is None:
+                    continue
+                try:
+                    stat = os.stat(row[0])
+                except OSError:
+                    stat = None
+                if stat is not None and (stat.st_mtime_ns, stat.st_size) == (row[1], row[2]):
+                    found[digest] = row[0]
+                else:
+                    stale.append((directory, digest, extension))
+            if stale:
+                with conn:
+                    conn.executemany("DELETE FROM content WHERE directory = ? AND hash = ? AND extension = ?",
+                                     stale)
+        return found
+
+    def add(self, directory, extension, entries):
+        """Record [(hash, path)] for newly written files, replacing whatever the paths held before."""
+        directory = os.path.abspath(directory)
+        rows = []
+        for digest, path in entries:
+            stat = os.stat(path)
+            rows.append((directory, digest, extension, path, stat.st_mtime_ns, stat.st_size))
+        with self._lock, self.connect() as conn:
+            with conn:
+                # A path overwritten with new pixels no longer holds its old hash
+                conn.executemany("DELETE FROM content WHERE path = ?", ((row[3],) for row in rows))
+                conn.executemany("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+CONTENT_INDEX = ContentIndex()
@@ -0,0 +1,142 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .offset_index import CACHE_DIR
+
+CURSOR_DB_PATH = os.path.join(CACHE_DIR, "cursors.sqlite")
+# 每个进程在这里持有一个加锁的小数据库，其他进程据此判断它是否还在运行
+CURSOR_OWNERS_DIR = os.path.join(CACHE_DIR, "cursor_owners")
+
+
+class CursorStore:
+    """
+    SequentialImageLoader 的持久化计数器，键为 文件夹 + 扩展名 + 节点 id（+ 分片）。
+
+    每一行记录下一个要分配的值（next），以及最近一次领取、还没确认处理完的批次
+    （claimed）和领取它的进程（owner）。分配在 sqlite 的 IMMEDIATE 事务中完成，
+    next 只增不减，多个 ComfyUI 进程共用同一个数据库时也不会拿到相同的值。
+
+    同一进程再次推进计数器、或正常退出时，之前领取的批次视为已处理完。
+    领取它的进程已经不在（崩溃）时，下一次推进重新分配这个批次，而不是 next。
+    """
+
+    def __init__(self, db_path=CURSOR_DB_PATH, owners_dir=CURSOR_OWNERS_DIR):
+        self.db_path = db_path
+        self.owners_dir = owners_dir
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._lock = threading.Lock()
+        self._conn = None
+        self._owner_conn = None
+
+    def _connect(self):
+        """第一次使用时建立连接和表，之后一直复用"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            # WAL 下进程崩溃不会丢失已提交的事务，只有断电可能丢失最后几次推进
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cursors (
+                    key TEXT PRIMARY KEY,
+                    folder TEXT,
+                    extensions TEXT,
+                    node_id TEXT,
+                    shard TEXT,
+                    next INTEGER,
+                    claimed INTEGER,
+                    owner TEXT,
+                    updated REAL
+                )
+            """)
+            self._hold_owner_lock()
+            self._conn = conn
+            atexit.register(self.release)
+        return self._conn
+
+    def _owner_path(self, owner):
+        return os.path.join(self.owners_dir, f"{owner}.sqlite")
+
+    def _hold_owner_lock(self):
+        # 锁随连接一直持有，进程退出（包括崩溃）时由操作系统释放
+        os.makedirs(self.owners_dir, exist_ok=True)
+        self._owner_conn = sqlite3.connect(self._owner_path(self.owner), isolation_level=None,
+                                           check_same_thread=False)
+        self._owner_conn.execute("BEGIN EXCLUSIVE")
+
+    def _owner_alive(self, owner):
+        path = self._owner_path(owner)
+        if not os.path.exists(path):
+            return False
+        probe = sqlite3.connect(path, timeout=0, isolation_level=None)
+        try:
+            probe.execute("BEGIN IMMEDIATE")
+            probe.execute("ROLLBACK")
+        except sqlite3.OperationalError:
+            return True
+        finally:
+            probe.close()
+        os.remove(path)
+        return False
+
+    def advance(self, key, folder, extensions, node_id, step, shard=""):
+        """
+        返回本次使用的计数器值：第一次使用为 0，之后每次前进 step；领取上一个
+        批次的进程崩溃时，重新返回那个批次的值。
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT next, claimed, owner FROM cursors WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    counter, next_counter = 0, step
+                elif row[1] is not None and row[2] != self.owner and not self._owner_alive(row[2]):
+                    counter, next_counter = row[1], row[0]
+                else:
+                    counter, next_counter = row[0], row[0] + step
+                conn.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, folder, extensions, node_id, shard, next_counter, counter, self.owner,
+                              time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return counter
+
+    def release(self):
+        """正常退出：本进程领取的批次都已处理完，不再重新分配"""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute("UPDATE cursors SET claimed = NULL WHERE owner = ?", (self.owner,))
+            self._conn.close()
+            self._owner_conn.close()
+            os.remove(self._owner_path(self.owner))
+            self._conn = self._owner_conn = None
+
+    def inspect(self, folder_filter="", shard_filter=""):
+        """
+        按文件夹和分片筛选的计数器：[(folder, extensions, node_id, shard, next, claimed, updated)]，
+        claimed 为还没确认处理完的批次（没有时为 None）
+        """
+        with self._lock:
+            return self._connect().execute(
+                "SELECT folder, extensions, node_id, shard, next, claimed, updated FROM cursors "
+                "WHERE instr(folder, ?) > 0 AND (? = '' OR shard = ?) ORDER BY folder, extensions, node_id, shard",
+                (folder_filter, shard_filter, shard_filter)).fetchall()
+
+    def reset(self, folder_filter="", shard_filter=""):
+        """删除匹配的计数器，下次从头开始；返回删除的数量"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "DELETE FROM cursors WHERE instr(folder, ?) > 0 AND (? = '' OR shard = ?)",
+                (folder_filter, shard_filter, shard_filter))
+        return cursor.rowcount
+
+
+CURSOR_STORE = CursorStore()
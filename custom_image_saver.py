@@ -1,11 +1,51 @@
 import os
-import numpy as np
 from PIL import Image
 import torch
 import folder_paths
 from datetime import datetime
 import json
-import hashlib
+import logging
+import re
+import time
+
+from .content_index import CONTENT_INDEX
+from .filename_counter import FILENAME_COUNTER
+from .fingerprint import pixel_hash
+from .image_batch import quantize_batch
+from .image_writer import IMAGE_WRITER, encode_image, map_in_order, resolve_workers, save_atomic, timing_summary
+from .shard_writer import DEFAULT_SHARD_MB, OUTPUT_MODES, get_shard_writer
+
+logger = logging.getLogger(__name__)
+
+# Captions for a batch are separated by a line holding only ---, like TextLoad's default separator
+CAPTION_SEPARATOR_RE = re.compile(r"^[ \t]*---[ \t]*$", re.MULTILINE)
+
+
+def split_captions(caption, count):
+    """One caption per image (None without a caption); a single caption is shared by the batch."""
+    if not caption.strip():
+        return [None] * count
+    captions = [part.strip() for part in CAPTION_SEPARATOR_RE.split(caption)]
+    if len(captions) == 1:
+        return captions * count
+    if len(captions) != count:
+        raise ValueError(f"Got {len(captions)} captions for {count} images")
+    return captions
+
+
+def sample_members(format, data, caption):
+    """Archive members of one sample: the image, then its caption under the same key."""
+    members = {format: data}
+    if caption is not None:
+        members["txt"] = caption.encode('utf-8')
+    return members
+
+
+def quantize_images(images):
+    """Whole batch to uint8 in one pass; returns the pixels and the seconds it took."""
+    start = time.perf_counter()
+    pixels = quantize_batch(images)
+    return pixels, time.perf_counter() - start
 
 class CustomImageSaver:
     def __init__(self):
@@ -52,6 +92,34 @@ class CustomImageSaver:
                 "metadata": ("STRING", {
                     "default": "",
                     "multiline": True
+                }),
+                "async_save": ("BOOLEAN", {
+                    "default": False
+                }),
+                "encode_workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1
+                }),
+                "output_mode": (OUTPUT_MODES, {
+                    "default": "files"
+                }),
+                "shard_name": ("STRING", {
+                    "default": "shard",
+                    "multiline": False
+                }),
+                "max_shard_mb": ("INT", {
+                    "default": DEFAULT_SHARD_MB,
+                    "min": 1,
+                    "max": 65536,
+                    "step": 1
+                }),
+                # tar/zip only: stored as <key>.txt right after the image, in the same sample.
+                # Separate per-image captions with a line holding only ---; one caption is shared
+                "caption": ("STRING", {
+                    "default": "",
+                    "multiline": True
                 })
             }
         }
@@ -63,7 +131,15 @@ class CustomImageSaver:
     CATEGORY = "image/io"
 
     def save_images(self, images, filename, format, save_path, add_timestamp, 
-                   add_counter, quality, png_compression, metadata=""):
+                   add_counter, quality, png_compression, metadata="", async_save=False,
+                   encode_workers=0, output_mode="files", shard_name="shard", max_shard_mb=DEFAULT_SHARD_MB,
+                   caption=""):
+        
+        batch_start = time.perf_counter()
+        # Failed background writes from earlier executions are reported here
+        write_errors = IMAGE_WRITER.take_errors()
+        for error in write_errors:
+            logger.error("Background image write failed: %s", error)
         
         results = []
         saved_paths = []
@@ -84,38 +160,48 @@ class CustomImageSaver:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             base_filename = f"{base_filename}_{timestamp}"
         
-        for idx, image in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8).squeeze())
-            
+        save_kwargs = {}
+        
+        if format in ['jpg', 'jpeg', 'webp']:
+            save_kwargs['quality'] = quality
+            if format == 'webp':
+                save_kwargs['lossless'] = False
+        elif format == 'png':
+            save_kwargs['compress_level'] = png_compression
+            save_kwargs['optimize'] = True
+        
+        if metadata and format in ['png', 'webp']:
+            from PIL import PngImagePlugin
+            pnginfo = PngImagePlugin.PngInfo()
+            pnginfo.add_text("metadata", metadata)
+            save_kwargs['pnginfo'] = pnginfo
+        
+        shard_writer = None
+        if output_mode != "files":
+            shard_writer = get_shard_writer(output_dir, shard_name, output_mode, max_shard_mb)
+            captions = split_captions(caption, len(images))
+        
+        # Names are assigned up front in batch order; only conversion and encoding run in parallel
+        full_paths = []
+        keys = []
+        for idx in range(len(images)):
             if add_counter and len(images) > 1:
                 current_filename = f"{base_filename}_{idx:04d}"
+            elif add_counter and shard_writer is not None:
+                # Archive keys are numbered from the shard index; no loose file name is reserved
+                current_filename = f"{base_filename}_{shard_writer.next_counter(base_filename):04d}"
             elif add_counter:
-                counter = self._get_next_counter(output_dir, base_filename, format)
+                counter = FILENAME_COUNTER.reserve(
+                    output_dir, base_filename, format,
+                    lambda: self._get_next_counter(output_dir, base_filename, format))
                 current_filename = f"{base_filename}_{counter:04d}"
             else:
                 current_filename = base_filename
             
             full_filename = f"{current_filename}.{format}"
             full_path = os.path.join(output_dir, full_filename)
-            
-            save_kwargs = {}
-            
-            if format in ['jpg', 'jpeg', 'webp']:
-                save_kwargs['quality'] = quality
-                if format == 'webp':
-                    save_kwargs['lossless'] = False
-            elif format == 'png':
-                save_kwargs['compress_level'] = png_compression
-                save_kwargs['optimize'] = True
-            
-            if metadata and format in ['png', 'webp']:
-                from PIL import PngImagePlugin
-                pnginfo = PngImagePlugin.PngInfo()
-                pnginfo.add_text("metadata", metadata)
-                save_kwargs['pnginfo'] = pnginfo
-            
-            img.save(full_path, **save_kwargs)
+            full_paths.append(full_path)
+            keys.append(current_filename)
             
             saved_paths.append(full_path)
             saved_filenames.append(full_filename)
@@ -126,14 +212,62 @@ class CustomImageSaver:
                 "type": self.type
             })
         
+        pixels, convert_seconds = quantize_images(images)
+        
+        def save_one(idx):
+            convert_start = time.perf_counter()
+            img = Image.fromarray(pixels[idx].squeeze())
+            encode_start = time.perf_counter()
+            if shard_writer is not None:
+                # Encoded in parallel, appended to the shard below in batch order
+                data = encode_image(img, format, save_kwargs)
+                return encode_start - convert_start, time.perf_counter() - encode_start, data
+            if async_save:
+                # Encoding and writing happen on the writer threads; the path is reserved now
+                IMAGE_WRITER.submit(full_paths[idx], img, save_kwargs)
+            else:
+                # Written via a temp file, so workers saving the same name never interleave
+                save_atomic(img, full_paths[idx], save_kwargs)
+            return encode_start - convert_start, time.perf_counter() - encode_start
+        
+        workers = resolve_workers(encode_workers, len(images))
+        timings = map_in_order(save_one, range(len(images)), workers)
+        
+        if shard_writer is not None:
+            shard_paths = []
+            try:
+                for idx, timing in enumerate(timings):
+                    shard_path, key = shard_writer.write(keys[idx], sample_members(format, timing[2], captions[idx]))
+                    saved_filenames[idx] = f"{key}.{format}"
+                    saved_paths[idx] = f"{shard_path}/{saved_filenames[idx]}"
+                    shard_paths.append(shard_path)
+            finally:
+                # Finalize the shard so it is a readable archive between executions
+                shard_writer.close()
+            # Archive members cannot be previewed as output files
+            results = []
+        elif async_save:
+            # Files still queued are left out of the preview; their paths are returned all the same
+            pending = IMAGE_WRITER.pending_names(output_dir)
+            results = [result for result in results if result["filename"] not in pending]
+        
+        ui = {"images": results,
+              "timing": [timing_summary(timings, workers, time.perf_counter() - batch_start,
+                                        "queue" if async_save else "encode", convert_seconds)]}
+        if shard_writer is not None:
+            ui["shards"] = sorted(set(shard_paths))
+        if write_errors:
+            ui["write_errors"] = write_errors
         return {
-            "ui": {"images": results},
+            "ui": ui,
             "result": ("; ".join(saved_paths), "; ".join(saved_filenames))
         }
     
     def _get_next_counter(self, directory, base_filename, extension):
+        # Full directory scan, only used to seed the persistent counter
         pattern = f"{base_filename}_"
-        existing_files = [f for f in os.listdir(directory) 
+        # Files still queued for a background write already own their names
+        existing_files = [f for f in set(os.listdir(directory)) | IMAGE_WRITER.pending_names(directory)
                          if f.startswith(pattern) and f.endswith(f".{extension}")]
         
         if not existing_files:
@@ -181,6 +315,36 @@ class BatchImageSaver:
                     "max": 100,
                     "step": 1
                 })
+            },
+            "optional": {
+                "encode_workers": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1
+                }),
+                "dedup": ("BOOLEAN", {
+                    "default": False
+                }),
+                "output_mode": (OUTPUT_MODES, {
+                    "default": "files"
+                }),
+                "shard_name": ("STRING", {
+                    "default": "shard",
+                    "multiline": False
+                }),
+                "max_shard_mb": ("INT", {
+                    "default": DEFAULT_SHARD_MB,
+                    "min": 1,
+                    "max": 65536,
+                    "step": 1
+                }),
+                # tar/zip only: stored as <key>.txt right after the image, in the same sample.
+                # Separate per-image captions with a line holding only ---; one caption is shared
+                "caption": ("STRING", {
+                    "default": "",
+                    "multiline": True
+                })
             }
         }
 
@@ -191,8 +355,12 @@ class BatchImageSaver:
     CATEGORY = "image/io"
 
     def save_batch(self, images, base_filename, format, save_path, 
-                  naming_pattern, custom_pattern, quality):
+                  naming_pattern, custom_pattern, quality, encode_workers=0, dedup=False,
+                  output_mode="files", shard_name="shard", max_shard_mb=DEFAULT_SHARD_MB, caption=""):
         
+        batch_start = time.perf_counter()
+        # The dedup index points at files, so it only applies to plain file output
+        dedup = dedup and output_mode == "files"
         output_dir = folder_paths.get_output_directory()
         if save_path:
             if os.path.isabs(save_path):
@@ -208,15 +376,42 @@ class BatchImageSaver:
         results = []
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        for idx, image in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8).squeeze())
+        save_kwargs = {}
+        if format in ['jpg', 'jpeg', 'webp']:
+            save_kwargs['quality'] = quality
+        elif format == 'png':
+            save_kwargs['compress_level'] = 6
+            save_kwargs['optimize'] = True
+        
+        pixels, convert_seconds = quantize_images(images)
+        workers = resolve_workers(encode_workers, len(images))
+        
+        # Each image's uint8 pixels are hashed at most once, for hash names and dedup alike
+        needs_hash = dedup or naming_pattern == "hash" or (naming_pattern == "custom" and "{hash" in custom_pattern)
+        hashes = map_in_order(pixel_hash, list(pixels), workers) if needs_hash else [None] * len(images)
+        
+        # Dedup: images already in this folder (or earlier in the batch) are not encoded again
+        existing = CONTENT_INDEX.lookup(full_output_dir, format, hashes) if dedup else {}
+        duplicate_of = {}
+        if dedup:
+            first_index = {}
+            for idx, digest in enumerate(hashes):
+                if digest not in existing:
+                    duplicate_of[idx] = first_index.setdefault(digest, idx)
+        
+        # Hash-based names depend on the pixels, so each worker names its own image;
+        # results come back in batch order
+        def save_one(idx):
+            if dedup and (hashes[idx] in existing or duplicate_of[idx] != idx):
+                return None
+            convert_start = time.perf_counter()
+            img = Image.fromarray(pixels[idx].squeeze())
+            encode_start = time.perf_counter()
             
             if naming_pattern == "index":
                 filename = f"{base_filename}_{idx:04d}"
             elif naming_pattern == "hash":
-                img_hash = hashlib.md5(i.tobytes()).hexdigest()[:8]
-                filename = f"{base_filename}_{img_hash}"
+                filename = f"{base_filename}_{hashes[idx][:8]}"
             elif naming_pattern == "timestamp_index":
                 filename = f"{base_filename}_{timestamp}_{idx:04d}"
             elif naming_pattern == "custom":
@@ -224,20 +419,48 @@ class BatchImageSaver:
                     base=base_filename,
                     index=idx,
                     timestamp=timestamp,
-                    hash=hashlib.md5(i.tobytes()).hexdigest()[:8]
+                    hash=hashes[idx][:8] if hashes[idx] else ""
                 )
             
             full_filename = f"{filename}.{format}"
             full_path = os.path.join(full_output_dir, full_filename)
-            
-            save_kwargs = {}
-            if format in ['jpg', 'jpeg', 'webp']:
-                save_kwargs['quality'] = quality
-            elif format == 'png':
-                save_kwargs['compress_level'] = 6
-                save_kwargs['optimize'] = True
-            
-            img.save(full_path, **save_kwargs)
+            if shard_writer is not None:
+                # Encoded in parallel, appended to the shard below in batch order
+                data = encode_image(img, format, save_kwargs)
+                return full_filename, (filename, data), encode_start - convert_start, time.perf_counter() - encode_start
+            # Identical hash names or a custom pattern without {index} can repeat within a
+            # batch; writing via a temp file keeps concurrent saves of one name intact
+            save_atomic(img, full_path, save_kwargs)
+            return full_filename, full_path, encode_start - convert_start, time.perf_counter() - encode_start
+        
+        shard_writer = None
+        if output_mode != "files":
+            shard_writer = get_shard_writer(full_output_dir, shard_name, output_mode, max_shard_mb)
+            captions = split_captions(caption, len(images))
+        saved = map_in_order(save_one, range(len(images)), workers)
+        
+        if shard_writer is not None:
+            shard_paths = []
+            try:
+                for idx, (full_filename, (key, data), convert, encode) in enumerate(saved):
+                    shard_path, key = shard_writer.write(key, sample_members(format, data, captions[idx]))
+                    full_filename = f"{key}.{format}"
+                    saved[idx] = (full_filename, f"{shard_path}/{full_filename}", convert, encode)
+                    shard_paths.append(shard_path)
+            finally:
+                # Finalize the shard so it is a readable archive between executions
+                shard_writer.close()
+        
+        deduplicated = sum(1 for entry in saved if entry is None)
+        if dedup:
+            CONTENT_INDEX.add(full_output_dir, format,
+                              [(hashes[idx], entry[1]) for idx, entry in enumerate(saved) if entry is not None])
+            for idx, entry in enumerate(saved):
+                if entry is None:
+                    full_path = existing.get(hashes[idx]) or saved[duplicate_of[idx]][1]
+                    saved[idx] = (os.path.basename(full_path), full_path, 0.0, 0.0)
+        
+        for full_filename, full_path, _, _ in saved:
             saved_paths.append(full_path)
             
             results.append({
@@ -246,18 +469,66 @@ class BatchImageSaver:
                 "type": "output"
             })
         
+        timings = [(convert, encode) for _, _, convert, encode in saved]
+        ui = {"images": results,
+              "timing": [timing_summary(timings, workers, time.perf_counter() - batch_start,
+                                        convert_seconds=convert_seconds)],
+              "deduplicated": [deduplicated]}
+        if shard_writer is not None:
+            # Archive members cannot be previewed as output files
+            ui["images"] = []
+            ui["shards"] = sorted(set(shard_paths))
         return {
-            "ui": {"images": results},
+            "ui": ui,
             "result": ("; ".join(saved_paths), len(saved_paths))
         }
 
 
+class ImageWriterStatus:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "wait_for_pending": ("BOOLEAN", {
+                    "default": False
+                })
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "INT")
+    RETURN_NAMES = ("status", "pending")
+    FUNCTION = "get_status"
+    OUTPUT_NODE = True
+    CATEGORY = "image/io"
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        return float("NaN")
+
+    def get_status(self, wait_for_pending):
+        if wait_for_pending:
+            IMAGE_WRITER.flush()
+        status = IMAGE_WRITER.status()
+        lines = [
+            f"Pending: {status['pending']}",
+            f"Written: {status['written']}",
+            f"Failed: {status['failed']}",
+            f"Time blocked on a full queue: {status['blocked_seconds']:.2f}s",
+        ]
+        if status["recent_errors"]:
+            lines.append("Recent errors:")
+            lines.extend(status["recent_errors"])
+        return ("\n".join(lines), status["pending"])
+
+
 NODE_CLASS_MAPPINGS = {
     "CustomImageSaver": CustomImageSaver,
-    "BatchImageSaver": BatchImageSaver
+    "BatchImageSaver": BatchImageSaver,
+    "ImageWriterStatus": ImageWriterStatus
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CustomImageSaver": "Custom Image Saver",
-    "BatchImageSaver": "Batch Image Saver"
+    "BatchImageSaver": "Batch Image Saver",
+    "ImageWriterStatus": "Image Writer Status"
 }
\ No newline at end of file
@@ -0,0 +1,413 @@
+import hashlib
+import mmap
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+LOAD_MODES = ["by_line", "by_double_newline", "by_custom_separator"]
+
+BRACKET_TITLE_LINE_RE = re.compile(r'\[([^\]]+)\]\s*(.*)')
+BRACKET_TITLE_RE = re.compile(r'\[([^\]]+)\]')
+BRACKET_ONLY_LINE_RE = re.compile(r'^\[.*\]$')
+
+# UTF-8 encodings of every character str.strip() removes
+WS_RE = rb'(?:[\t\n\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)'
+WS_RUN_RE = re.compile(WS_RE + rb'*')
+ASCII_WS = frozenset(b'\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f ')
+MULTIBYTE_WS = frozenset([
+    b'\xc2\x85', b'\xc2\xa0', b'\xe1\x9a\x80', b'\xe2\x81\x9f', b'\xe3\x80\x80',
+    b'\xe2\x80\xa8', b'\xe2\x80\xa9', b'\xe2\x80\xaf',
+] + [b'\xe2\x80' + bytes([b]) for b in range(0x80, 0x8b)])
+
+# Files are read in text mode, so \r\n and \r count as \n
+NEWLINE = rb'(?:\r\n|\r(?!\n)|\n)'
+LINE_RE = re.compile(rb'[^\r\n]+')
+DOUBLE_NEWLINE_RE = re.compile(NEWLINE * 2)
+# Longest DOUBLE_NEWLINE_RE match (\r\n\r\n) plus the \r lookahead
+DOUBLE_NEWLINE_MARGIN = 5
+
+# Read size for streaming scans
+CHUNK_SIZE = 1024 * 1024
+
+# Bytes hashed at each end of the old contents to confirm a file was only appended to
+PROBE_BYTES = 64 * 1024
+
+
+def scan_key(load_mode, custom_separator):
+    """Normalise (load_mode, custom_separator) to what actually affects the split."""
+    if load_mode == "by_custom_separator":
+        return load_mode, custom_separator
+    if load_mode == "by_double_newline":
+        return load_mode, None
+    # by_line, and the fallback for unrecognized modes
+    return "by_line", None
+
+
+def separator_regex(separator):
+    """Byte pattern matching separator as it would appear after newline translation."""
+    if not separator:
+        raise ValueError("empty separator")
+    if '\r' in separator:
+        # Text mode never yields \r, so such a separator can never match
+        return re.compile(rb'(?!)')
+    parts = [re.escape(part.encode('utf-8')) for part in separator.split('\n')]
+    return re.compile(NEWLINE.join(parts))
+
+
+def lstrip_offset(buf, start, end):
+    return WS_RUN_RE.match(buf, start, end).end()
+
+
+def rstrip_offset(buf, start, end):
+    while end > start:
+        if buf[end - 1] in ASCII_WS:
+            end -= 1
+        # bytes() because scan_stream's window is an (unhashable) bytearray
+        elif end - start >= 2 and bytes(buf[end - 2:end]) in MULTIBYTE_WS:
+            end -= 2
+        elif end - start >= 3 and bytes(buf[end - 3:end]) in MULTIBYTE_WS:
+            end -= 3
+        else:
+            break
+    return end
+
+
+def decode_group(raw):
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def utf8_complete_end(buf):
+    """Length of buf without a trailing, incomplete UTF-8 sequence."""
+    n = len(buf)
+    for back in range(1, min(4, n) + 1):
+        b = buf[n - back]
+        if b & 0xC0 != 0x80:
+            need = 4 if b >= 0xF0 else 3 if b >= 0xE0 else 2 if b >= 0xC0 else 1
+            return n - back if need > back else n
+    return n
+
+
+def scan_window(buf, load_mode, custom_separator, pos, final, scanned=None):
+    """
+    Yield group spans found in buf[pos:]. Unless final, stops before anything
+    that more data could still change (the group holding the last non-whitespace
+    byte, or a separator too close to the end) and returns (resume, end): where
+    to resume, and how far this call searched.
+
+    scanned is the end returned by the previous call on the same window (moved
+    by any trimming). No separator starts before it, so only the new tail is
+    searched again and a group spanning many chunks is not rescanned for each.
+    """
+    end = rstrip_offset(buf, pos, len(buf) if final else utf8_complete_end(buf))
+    # A separator straddling the old end starts at most this far before it
+    search_from = pos if scanned is None else max(pos, scanned - DOUBLE_NEWLINE_MARGIN)
+
+    if load_mode == "by_double_newline":
+        # Separators are whitespace, so every match before `end` is final
+        for m in DOUBLE_NEWLINE_RE.finditer(buf, search_from, end):
+            yield pos, m.start()
+            pos = m.end()
+        if final:
+            yield pos, end
+            return end
+        return pos, end
+
+    if load_mode == "by_custom_separator":
+        regex = separator_regex(custom_separator)
+        # Longest possible match (every \n written as \r\n) plus the \r lookahead
+        margin = len(custom_separator.encode('utf-8')) + custom_separator.count('\n') + 1
+        if scanned is not None:
+            # Matches this close to the old end were deferred, not consumed
+            search_from = max(pos, scanned - margin)
+        for m in regex.finditer(buf, search_from, end):
+            if not final and m.start() + margin > end:
+                break
+            piece_start = lstrip_offset(buf, pos, m.start())
+            piece_end = rstrip_offset(buf, piece_start, m.start())
+            if piece_end > piece_start:
+                yield piece_start, piece_end
+            pos = m.end()
+        if final:
+            piece_start = lstrip_offset(buf, pos, end)
+            piece_end = rstrip_offset(buf, piece_start, end)
+            if piece_end > piece_start:
+                yield piece_start, piece_end
+            return end
+        return pos, end
+
+    if not final and buf.find(b'\n', search_from, end) < 0 and buf.find(b'\r', search_from, end) < 0:
+        # Still inside the line that starts at pos
+        return pos, end
+    for m in LINE_RE.finditer(buf, pos, end):
+        line_start, line_end = m.span()
+        if not final and line_end >= end:
+            # Possibly the last line of the file, which gets right-stripped
+            return line_start, end
+        # Printable ASCII can't be whitespace; only fall back to the regex otherwise
+        if 0x21 <= buf[line_start] <= 0x7e or lstrip_offset(buf, line_start, line_end) < line_end:
+            yield line_start, line_end
+    return end if final else (pos, end)
+
+
+def scan_spans(buf, load_mode, custom_separator="---", resume_at=None):
+    """
+    Yield the (start, end) byte span of every group in buf. Decoding the spans
+    gives exactly what TextLoad has always produced with text.strip().split(...).
+
+    resume_at continues a previous scan from the offset returned by resume_point().
+    """
+    if resume_at is None:
+        resume_at = lstrip_offset(buf, 0, len(buf))
+    yield from scan_window(buf, load_mode, custom_separator, resume_at, final=True)
+
+
+def scan_stream(stream, load_mode, custom_separator="---", resume_at=None, chunk_size=CHUNK_SIZE):
+    """
+    Like scan_spans, but reads a binary stream in chunks so memory stays bounded
+    by the chunk size and the largest group. Yields (start, end, raw_bytes) with
+    offsets counted from resume_at (0 for a fresh scan).
+    """
+    # Grown and trimmed in place; rebuilding a bytes window per chunk is quadratic in a long group
+    window = bytearray()
+    base = resume_at or 0
+    started = resume_at is not None
+    scanned = None
+    while True:
+        chunk = stream.read(chunk_size)
+        final = not chunk
+        window += chunk
+        pos = 0
+        if not started:
+            # Leading whitespace of the whole file is stripped, like text.strip()
+            pos = lstrip_offset(window, 0, len(window) if final else utf8_complete_end(window))
+            started = final or pos < utf8_complete_end(window)
+            if not started:
+                del window[:pos]
+                base += pos
+                continue
+        spans = scan_window(window, load_mode, custom_separator, pos, final, scanned)
+        while True:
+            try:
+                start, end = next(spans)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            yield base + start, base + end, bytes(window[start:end])
+        if final:
+            return
+        resume, scanned = result
+        del window[:resume]
+        base += resume
+        scanned -= resume
+
+
+def prefix_probe(buf, size):
+    """Hash of the head and tail of buf[:size], used to detect pure appends."""
+    h = hashlib.sha1()
+    h.update(buf[:min(size, PROBE_BYTES)])
+    h.update(buf[max(0, size - PROBE_BYTES):size])
+    return h.hexdigest()
+
+
+def resume_point(buf, tail_spans, count, load_mode, custom_separator):
+    """
+    Where to continue scanning once a file has grown: (groups_to_keep, offset),
+    or None when a full rescan is needed. The last group is always rescanned
+    because appended text may extend it; in custom mode the separator before it
+    is matched again so one straddling the old end of file is still recognised.
+    """
+    if load_mode == "by_custom_separator":
+        if count < 2:
+            return None
+        m = separator_regex(custom_separator).search(buf, tail_spans[-2][1])
+        if m is None:
+            return None
+        return count - 1, m.end()
+    if count < 1:
+        return None
+    start, end = tail_spans[-1]
+    if start == end:
+        # by_double_newline on an all-whitespace file
+        return None
+    return count - 1, start
+
+
+@contextmanager
+def open_source(file_path):
+    """mmap a source file read-only; empty files yield b'' since mmap rejects them."""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+
+def parse_group(group, index, load_mode):
+    """
+    Parse one group into (title, content, has_title).
+    has_title is False when neither a [title] nor a speaker: prefix matched.
+    """
+    if load_mode == "by_line":
+        title_match = BRACKET_TITLE_LINE_RE.match(group)
+        if title_match:
+            title = title_match.group(1)
+            content = title_match.group(2) if title_match.group(2) else group
+            return title, content, True
+        parts = group.split(':', 1)
+        if len(parts) > 1:
+            return parts[0].strip(), parts[1].strip(), True
+        return f"Line {index}", group, False
+
+    lines = group.strip().split('\n')
+    title_match = BRACKET_TITLE_RE.match(lines[0])
+    title = title_match.group(1) if title_match else lines[0]
+    content = '\n'.join(line for line in lines if not BRACKET_ONLY_LINE_RE.match(line))
+    return title, content, bool(title_match)
+
+
+def listing_title(title, has_title, index, load_mode):
+    """Title as listed by TextLoadCounter: untitled multi-line groups show as "Group N"."""
+    if has_title or load_mode == "by_line":
+        return title
+    return f"Group {index}"
+
+
+def file_signature(file_path):
+    """(path, mtime, size) - changes whenever the file is modified."""
+    st = os.stat(file_path)
+    return (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+
+class ParsedGroups:
+    """All groups of one file for one load mode, with titles and contents precomputed."""
+
+    def __init__(self, signature, load_mode, custom_separator):
+        self.signature = signature
+        self.load_mode = load_mode
+        self.custom_separator = custom_separator
+        self.groups = []
+        self.titles = []
+        self.contents = []
+        # Indices of groups without a recognised title, used by listing_title
+        self.untitled = set()
+        # Byte spans of the last two groups, all an incremental re-scan needs
+        self.tail_spans = []
+        self.probe = None
+        self.nbytes = sys.getsizeof(self)
+
+    def __len__(self):
+        return len(self.groups)
+
+    @classmethod
+    def parse(cls, file_path, load_mode, custom_separator, previous=None):
+        """Parse the file, reusing `previous` when the file has only been appended to."""
+        scan_mode = scan_key(load_mode, custom_separator)[0]
+        with open_source(file_path) as buf:
+            signature = file_signature(file_path)
+            size = len(buf)
+            parsed = cls(signature, load_mode, custom_separator)
+            resume = None
+            if previous is not None and previous.signature[2] < size \
+                    and prefix_probe(buf, previous.signature[2]) == previous.probe:
+                resume = resume_point(buf, previous.tail_spans, len(previous),
+                                      scan_mode, custom_separator)
+            if resume is not None:
+                keep, resume_at = resume
+                parsed._copy_head(previous, keep)
+            else:
+                resume_at = None
+            for start, end in scan_spans(buf, scan_mode, custom_separator, resume_at):
+                parsed._append(decode_group(buf[start:end]), start, end)
+            parsed.probe = prefix_probe(buf, size)
+        return parsed
+
+    def _copy_head(self, previous, keep):
+        dropped = len(previous) - keep
+        self.groups = previous.groups[:keep]
+        self.titles = previous.titles[:keep]
+        self.contents = previous.contents[:keep]
+        self.untitled = {i for i in previous.untitled if i < keep}
+        self.tail_spans = previous.tail_spans[:max(0, len(previous.tail_spans) - dropped)]
+        self.nbytes = previous.nbytes - sum(previous._group_nbytes(i) for i in range(keep, len(previous)))
+
+    def _append(self, group, start, end):
+        index = len(self.groups)
+        title, content, has_title = parse_group(group, index, self.load_mode)
+        self.groups.append(group)
+        self.titles.append(title)
+        self.contents.append(content)
+        if not has_title:
+            self.untitled.add(index)
+        self.tail_spans = self.tail_spans[-1:] + [(start, end)]
+        self.nbytes += self._group_nbytes(index)
+
+    def _group_nbytes(self, index):
+        group, title, content = self.groups[index], self.titles[index], self.contents[index]
+        # Three list slots plus the strings; title/content often alias the group itself
+        total = 24 + sys.getsizeof(group)
+        if title is not group:
+            total += sys.getsizeof(title)
+        if content is not group:
+            total += sys.getsizeof(content)
+        return total
+
+
+class GroupCache:
+    """
+    Process-wide cache of parsed dialogue files.
+    Keyed by (path, mtime, size, load_mode, custom_separator) with LRU eviction
+    under a memory budget. When a cached file has only grown, just the new tail
+    is parsed.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path, load_mode, custom_separator="---"):
+        if load_mode != "by_custom_separator":
+            # The separator only matters in custom mode; don't re-parse when it changes
+            custom_separator = None
+        key = file_signature(file_path) + (load_mode, custom_separator)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            previous = self._find_other_version(key)
+
+        entry = ParsedGroups.parse(file_path, load_mode, custom_separator, previous)
+
+        with self._lock:
+            # Entries for older versions of the same file can never hit again
+            stale = self._find_other_version(key)
+            while stale is not None:
+                self.current_bytes -= self._entries.pop(stale.signature + key[3:]).nbytes
+                stale = self._find_other_version(key)
+            self._entries[entry.signature + key[3:]] = entry
+            self.current_bytes += entry.nbytes
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+        return entry
+
+    def _find_other_version(self, key):
+        for other_key, entry in self._entries.items():
+            if other_key[0] == key[0] and other_key[3:] == key[3:]:
+                return entry
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+GROUP_CACHE = GroupCache()
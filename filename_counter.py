@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+from .offset_index import CACHE_DIR
+
+FILENAME_COUNTER_DB_PATH = os.path.join(CACHE_DIR, "filename_counters.sqlite")
+
+
+class FilenameCounter:
+    """
+    Next free counter per (directory, base name, extension), kept in sqlite so
+    that reserving a name costs the same at 10 files or 1M. The directory is
+    scanned once to seed a counter, and again only if the directory is replaced.
+    Reservations run in an IMMEDIATE transaction, so concurrent savers in other
+    processes never receive the same number.
+    """
+
+    def __init__(self, db_path=FILENAME_COUNTER_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                directory TEXT,
+                base TEXT,
+                extension TEXT,
+                directory_id TEXT,
+                next INTEGER,
+                PRIMARY KEY (directory, base, extension)
+            )
+        """)
+        return closing(conn)
+
+    def reserve(self, directory, base, extension, seed):
+        """
+        Claim the next counter for base_NNNN.extension in directory. seed() is
+        called to scan the directory when there is no stored counter yet.
+        """
+        directory = os.path.abspath(directory)
+        stat = os.stat(directory)
+        # A deleted and recreated directory gets a new inode and is re-seeded
+        directory_id = f"{stat.st_dev}:{stat.st_ino}"
+        with self._lock, self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT directory_id, next FROM counters "
+                                   "WHERE directory = ? AND base = ? AND extension = ?",
+                                   (directory, base, extension)).fetchone()
+                counter = row[1] if row is not None and row[0] == directory_id else seed()
+                # Files written without going through the counter (copied in, older
+                # versions) are stepped over rather than overwritten
+                while os.path.exists(os.path.join(directory, f"{base}_{counter:04d}.{extension}")):
+                    counter += 1
+                conn.execute("INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?, ?)",
+                             (directory, base, extension, directory_id, counter + 1))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return counter
+
+
+FILENAME_COUNTER = FilenameCounter()
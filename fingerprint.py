@@ -0,0 +1,92 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Files up to this size are fingerprinted by content, so rewriting a file with
+# identical bytes (re-exporting, copying over, touching) keeps cached outputs
+# valid; larger files fall back to mtime and size
+CONTENT_HASH_MAX_SIZE = 64 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# Number of (path, mtime, size) -> digest entries remembered between runs
+MAX_REMEMBERED_HASHES = 4096
+# Bytes read from each end of a file for sampled_hash
+SAMPLE_BYTES = 64 * 1024
+
+_hash_lock = threading.Lock()
+_hashes = OrderedDict()
+
+
+def content_hash(file_path, stat):
+    """blake2b of the file's bytes, computed once per (path, mtime, size)."""
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    with _hash_lock:
+        digest = _hashes.get(key)
+        if digest is not None:
+            _hashes.move_to_end(key)
+            return digest
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hashes[key] = digest
+        while len(_hashes) > MAX_REMEMBERED_HASHES:
+            _hashes.popitem(last=False)
+    return digest
+
+
+def file_fingerprint(file_path, hash_content=True):
+    """
+    Cheap value for IS_CHANGED: path plus content hash for small files, or path,
+    mtime and size otherwise. A missing file gets a stable marker so the node's
+    error output is cached until the file appears.
+    """
+    file_path = os.path.abspath(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return f"missing:{file_path}"
+    if hash_content and stat.st_size <= CONTENT_HASH_MAX_SIZE:
+        try:
+            return f"{file_path}:{stat.st_size}:{content_hash(file_path, stat)}"
+        except OSError:
+            pass
+    return f"{file_path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def folder_fingerprint(folder_path):
+    """Changes whenever an entry is added to, removed from or renamed in the folder."""
+    folder_path = os.path.abspath(folder_path)
+    try:
+        stat = os.stat(folder_path)
+    except OSError:
+        return f"missing:{folder_path}"
+    return f"{folder_path}:{stat.st_mtime_ns}"
+
+
+def sampled_hash(file_path, size=None):
+    """
+    blake2b of the file size plus its first and last 64 KB. Much cheaper than a
+    full content hash on large folders; equal values only mark candidate
+    duplicates, which should be confirmed with content_hash.
+    """
+    if size is None:
+        size = os.path.getsize(file_path)
+    h = hashlib.blake2b(size.to_bytes(8, 'little'), digest_size=16)
+    with open(file_path, 'rb') as f:
+        h.update(f.read(SAMPLE_BYTES))
+        if size > 2 * SAMPLE_BYTES:
+            f.seek(size - SAMPLE_BYTES)
+            h.update(f.read(SAMPLE_BYTES))
+        elif size > SAMPLE_BYTES:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def pixel_hash(pixels):
+    """blake2b of a uint8 pixel array and its shape, computed once per saved image."""
+    h = hashlib.blake2b(repr(pixels.shape).encode('ascii'), digest_size=16)
+    h.update(pixels.data if pixels.flags.c_contiguous else pixels.tobytes())
+    return h.hexdigest()
@@ -0,0 +1,102 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# 批量加载时尺寸不一致的处理方式，均以第一张图的尺寸为准
+#   resize: 直接拉伸到目标尺寸
+#   crop:   等比缩放到覆盖目标尺寸，再居中裁剪
+#   pad:    等比缩放到能放进目标尺寸，再居中补黑边
+#   list:   不统一尺寸，按列表输出每张图
+SIZE_POLICIES = ["resize", "crop", "pad", "list"]
+# 保存前量化时每次处理的元素数（约 16MB 的 float32），临时缓冲区能留在缓存里
+QUANTIZE_CHUNK = 4 * 1024 * 1024
+
+
+def match_channels(images):
+    """混有 RGB 和 RGBA 时给 RGB 图补上不透明的 alpha 通道"""
+    channels = max(image.shape[-1] for image in images)
+    if all(image.shape[-1] == channels for image in images):
+        return images
+    return [image if image.shape[-1] == channels
+            else torch.cat([image, torch.ones_like(image[..., :1])], dim=-1)
+            for image in images]
+
+
+def resize_image(image, height, width):
+    """[1,H,W,C] 双线性缩放"""
+    if image.shape[1] == height and image.shape[2] == width:
+        return image
+    resized = F.interpolate(image.permute(0, 3, 1, 2), size=(height, width),
+                            mode="bilinear", align_corners=False, antialias=True)
+    return resized.permute(0, 2, 3, 1).clamp(0.0, 1.0)
+
+
+def fit_image(image, height, width, policy):
+    """把 [1,H,W,C] 调整为 [1,height,width,C]"""
+    src_height, src_width = image.shape[1], image.shape[2]
+    if (src_height, src_width) == (height, width) or policy == "resize":
+        return resize_image(image, height, width)
+
+    scale_h, scale_w = height / src_height, width / src_width
+    scale = max(scale_h, scale_w) if policy == "crop" else min(scale_h, scale_w)
+    scaled_height = max(1, round(src_height * scale))
+    scaled_width = max(1, round(src_width * scale))
+    image = resize_image(image, scaled_height, scaled_width)
+
+    if policy == "crop":
+        top = (scaled_height - height) // 2
+        left = (scaled_width - width) // 2
+        return image[:, top:top + height, left:left + width, :]
+
+    canvas = image.new_zeros((1, height, width, image.shape[-1]))
+    top = (height - scaled_height) // 2
+    left = (width - scaled_width) // 2
+    canvas[:, top:top + scaled_height, left:left + scaled_width, :] = image
+    return canvas
+
+
+def stack_images(images, policy):
+    """
+    把多张 [1,H,W,C] 合成一个批次。返回 (batch, image_list)：尺寸一致或按
+    policy 统一后 batch 为 [N,H,W,C]，image_list 是 batch 的逐张视图；
+    policy 为 list 且尺寸不一致时 batch 只含第一张，image_list 为原图。
+    """
+    images = match_channels(images)
+    height, width = images[0].shape[1], images[0].shape[2]
+    same_size = all(image.shape[1] == height and image.shape[2] == width for image in images)
+    if not same_size:
+        if policy == "list":
+            return images[0], images
+        images = [fit_image(image, height, width, policy) for image in images]
+    batch = torch.cat(images, dim=0) if len(images) > 1 else images[0]
+    return batch, [batch[i:i + 1] for i in range(batch.shape[0])]
+
+
+def quantize_batch(images):
+    """
+    把 [B, H, W, C] 的 float 图像整批转换为 uint8 numpy 数组：乘 255、截断到 0..255
+    后向零取整，与逐张 np.clip(255. * x, 0, 255).astype(np.uint8) 结果相同。
+    GPU 上的张量在设备上分块计算后一次性拷贝到 CPU；CPU 上的 float32 张量直接
+    在共享内存的 numpy 视图上计算（torch 的 float -> uint8 拷贝在 CPU 上较慢）。
+    返回连续数组，out[i] 为第 i 张图的视图。
+    """
+    images = images.detach()
+    if images.device.type == "cpu" and images.dtype == torch.float32:
+        src = images.contiguous().numpy().reshape(-1)
+        out = np.empty(images.shape, dtype=np.uint8)
+        flat = out.reshape(-1)
+        buf = np.empty(min(QUANTIZE_CHUNK, src.size), dtype=np.float32)
+        for start in range(0, src.size, QUANTIZE_CHUNK):
+            chunk = buf[:len(src[start:start + QUANTIZE_CHUNK])]
+            np.multiply(src[start:start + QUANTIZE_CHUNK], np.float32(255.0), out=chunk)
+            np.clip(chunk, 0, 255, out=chunk)
+            flat[start:start + QUANTIZE_CHUNK] = chunk
+        return out
+
+    src = images.reshape(-1)
+    out = torch.empty(images.shape, dtype=torch.uint8, device=images.device)
+    flat = out.view(-1)
+    for start in range(0, src.numel(), QUANTIZE_CHUNK):
+        chunk = src[start:start + QUANTIZE_CHUNK].float() * 255.0
+        flat[start:start + QUANTIZE_CHUNK].copy_(chunk.clamp_(0, 255))
+    return out.cpu().numpy()
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+# 解码结果缓存的总字节上限，可用环境变量 DIALOGUE_EXTRACTOR_IMAGE_CACHE_MB 调整（0 表示关闭）
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("DIALOGUE_EXTRACTOR_IMAGE_CACHE_MB", "1024")) * 1024 * 1024
+# 设为 1 时以 uint8 保存（约为 float32 的 1/4），取出时再转换为 float
+IMAGE_CACHE_UINT8 = os.environ.get("DIALOGUE_EXTRACTOR_IMAGE_CACHE_UINT8", "0") == "1"
+
+
+def tensor_nbytes(tensor):
+    return tensor.element_size() * tensor.nelement()
+
+
+class DecodedImageCache:
+    """
+    进程内共享的解码图片 LRU 缓存，键为 (路径, mtime, 大小, 解码模式)。
+    文件被修改后旧版本的条目会在下次读取时被替换。
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES, store_uint8=IMAGE_CACHE_UINT8):
+        self.max_bytes = max_bytes
+        self.store_uint8 = store_uint8
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_path = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_path, mode, decode):
+        """返回 file_path 的 float 图像张量，未命中时调用 decode(file_path) 并缓存"""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size, mode)
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if stored is not None:
+            return self._load(stored)
+
+        image = decode(file_path)
+        self._put(key, self._store(image))
+        return image
+
+    def _store(self, image):
+        if self.store_uint8 and image.dtype == torch.float32:
+            # 图像本来就是 uint8 / 255 得到的，乘回去取整是无损的
+            return (image * 255.0).round_().to(torch.uint8)
+        # 调用方可能原地修改返回的张量，缓存中保存自己的副本
+        return image.clone()
+
+    @staticmethod
+    def _load(stored):
+        if stored.dtype == torch.uint8:
+            return stored.to(torch.float32).div_(255.0)
+        return stored.clone()
+
+    def _put(self, key, stored):
+        size = tensor_nbytes(stored)
+        if size > self.max_bytes:
+            return
+        file_path = key[0]
+        with self._lock:
+            # 文件被修改过时，旧版本的条目不会再被命中，直接移除
+            for old_key in list(self._keys_by_path.get(file_path, ())):
+                if old_key == key or old_key[1:3] != key[1:3]:
+                    self._remove(old_key)
+            self._entries[key] = stored
+            self._keys_by_path.setdefault(file_path, set()).add(key)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        stored = self._entries.pop(key)
+        self.nbytes -= tensor_nbytes(stored)
+        keys = self._keys_by_path[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_path[key[0]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self.nbytes = 0
+
+
+IMAGE_CACHE = DecodedImageCache()
@@ -0,0 +1,63 @@
+import numpy as np
+import torch
+from PIL import Image
+
+# 带透明通道的模式统一输出 RGBA，其余模式输出 RGB
+ALPHA_MODES = ("RGBA", "RGBa", "LA", "La", "PA")
+
+
+def tensor_mode(img):
+    """PIL 图像对应的输出模式：RGBA 或 RGB"""
+    if img.mode in ALPHA_MODES or (img.mode == "P" and "transparency" in img.info):
+        return "RGBA"
+    return "RGB"
+
+
+def image_to_tensor(img):
+    """
+    PIL 图像转为 ComfyUI 标准格式 (batch, height, width, channels) 的 float32 张量。
+
+    uint8 像素直接除以 255 写入新分配的张量，不再经过 np.array 拷贝和 astype
+    生成的中间数组；L 模式不转换成 RGB，直接把灰度广播到三个通道。
+    """
+    mode = tensor_mode(img)
+    channels = 4 if mode == "RGBA" else 3
+    width, height = img.size
+    out = torch.empty((1, height, width, channels), dtype=torch.float32)
+
+    target = out.numpy()[0]
+    if img.mode == "L":
+        # 灰度值广播到三个通道，一次写完
+        np.divide(np.asarray(img)[..., None], np.float32(255.0), out=target, dtype=np.float32)
+    else:
+        if img.mode != mode:
+            img = img.convert(mode)
+        # 与原来的 astype(float32) / 255.0 逐位一致
+        np.divide(np.asarray(img), np.float32(255.0), out=target, dtype=np.float32)
+    return out
+
+
+def shrink_image(img, max_side):
+    """
+    把长边缩小到 max_side。JPEG 先用 draft() 在解码阶段按 1/2、1/4、1/8
+    做 DCT 缩放，其他格式先用 reduce() 整数倍缩小，最后再精确缩放，
+    大图只需解码和处理一小部分像素。
+    """
+    if max_side <= 0 or max(img.size) <= max_side:
+        return img
+    scale = max_side / max(img.size)
+    target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if img.format == "JPEG":
+        # 直接按目标尺寸选 DCT 缩放比例（结果不小于目标尺寸），解码量最多减少到 1/64
+        img.draft(None, target)
+    if img.mode in ("1", "P"):
+        # 调色板图缩放只能用最近邻，先转成真彩色
+        img = img.convert(tensor_mode(img))
+    # reducing_gap: 先用 reduce() 整数倍缩小，剩余不超过 2 倍的部分再用 BICUBIC 缩放
+    return img.resize(target, Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+
+def load_image_tensor(file_path, max_side=0):
+    """读取图片为 [1,H,W,C] float32 张量；max_side > 0 时按长边限制缩小"""
+    with Image.open(file_path) as img:
+        return image_to_tensor(shrink_image(img, max_side))
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from PIL import Image
+
+from .fingerprint import content_hash, sampled_hash
+from .image_listing import RACY_WINDOW_NS
+from .image_prefetch import DECODE_WORKERS
+from .offset_index import CACHE_DIR
+
+IMAGE_INDEX_VERSION = 1
+# 索引所有 Pillow 能识别扩展名的文件，查询时再按节点的扩展名过滤
+IMAGE_SUFFIXES = tuple(sorted(ext.lower() for ext in Image.registered_extensions()))
+# 缓存的过滤结果个数
+MAX_FILTERED_LISTS = 16
+
+
+def probe_image(file_path, size):
+    """只读文件头取得尺寸和模式，不解码像素"""
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            mode = img.mode
+    except Exception:
+        width = height = mode = None
+    return width, height, mode, sampled_hash(file_path, size)
+
+
+class ImageIndex:
+    """
+    单个文件夹的图片元数据索引（尺寸、模式、大小、mtime、快速哈希），
+    存放在缓存目录下的 sqlite 中。目录 mtime 变化时只重新读取新增或
+    大小/mtime 变化的文件，已删除的文件从索引中移除。
+    """
+
+    def __init__(self, folder_path, db_path):
+        self.folder_path = folder_path
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._scanned_ns = None
+        self._rows = None
+        # 内容有变化时加 1，用于判断过滤结果是否过期
+        self.generation = 0
+
+    def connect(self):
+        return closing(sqlite3.connect(self.db_path))
+
+    def _create(self, conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS images (
+                name TEXT PRIMARY KEY,
+                width INTEGER,
+                height INTEGER,
+                mode TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS images_hash ON images (hash);
+        """)
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None or version[0] != str(IMAGE_INDEX_VERSION):
+            conn.execute("DELETE FROM images")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(IMAGE_INDEX_VERSION),))
+
+    def refresh(self):
+        """目录有变化时增量更新索引，返回 {文件名: (宽, 高, 模式, 大小, mtime, 哈希)}"""
+        with self._lock:
+            mtime_ns = os.stat(self.folder_path).st_mtime_ns
+            if self._rows is not None and mtime_ns == self._mtime_ns \
+                    and self._scanned_ns - self._mtime_ns >= RACY_WINDOW_NS:
+                return self._rows
+            scanned_ns = time.time_ns()
+
+            files = {}
+            with os.scandir(self.folder_path) as it:
+                for entry in it:
+                    if not entry.name.lower().endswith(IMAGE_SUFFIXES):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            with self.connect() as conn:
+                self._create(conn)
+                rows = {row[0]: row[1:] for row in conn.execute("SELECT * FROM images")}
+                removed = [name for name in rows if name not in files]
+                changed = [name for name, stat in files.items()
+                           if name not in rows or rows[name][3:5] != stat]
+
+                # 读文件头和哈希主要是 IO，用线程池并行
+                with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as pool:
+                    probes = pool.map(lambda name: probe_image(os.path.join(self.folder_path, name),
+                                                               files[name][0]), changed)
+                    updates = []
+                    for name, (width, height, mode, digest) in zip(changed, probes):
+                        size, file_mtime_ns = files[name]
+                        rows[name] = (width, height, mode, size, file_mtime_ns, digest)
+                        updates.append((name,) + rows[name])
+
+                for name in removed:
+                    del rows[name]
+                conn.executemany("DELETE FROM images WHERE name = ?", ((name,) for name in removed))
+                conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)", updates)
+                conn.commit()
+
+            if removed or changed:
+                self.generation += 1
+            self._rows = rows
+            self._mtime_ns = mtime_ns
+            self._scanned_ns = scanned_ns
+            return rows
+
+
+_indexes_lock = threading.Lock()
+_indexes = {}
+
+
+def get_image_index(folder_path):
+    folder_path = os.path.abspath(folder_path)
+    with _indexes_lock:
+        index = _indexes.get(folder_path)
+        if index is None:
+            digest = hashlib.sha1(folder_path.encode('utf-8')).hexdigest()[:20]
+            index = ImageIndex(folder_path, os.path.join(CACHE_DIR, f"{digest}.images.sqlite"))
+            _indexes[folder_path] = index
+        return index
+
+
+_filtered_lock = threading.Lock()
+_filtered = OrderedDict()
+
+
+def duplicate_names(folder_path, names, rows):
+    """names 中与排在前面的文件内容完全相同的文件（快速哈希分组后再用完整哈希确认）"""
+    by_hash = defaultdict(list)
+    for name in names:
+        row = rows.get(name)
+        if row is not None:
+            by_hash[row[5]].append(name)
+    duplicates = set()
+    for group in by_hash.values():
+        if len(group) < 2:
+            continue
+        seen = set()
+        for name in group:
+            file_path = os.path.join(folder_path, name)
+            try:
+                digest = content_hash(file_path, os.stat(file_path))
+            except OSError:
+                continue
+            if digest in seen:
+                duplicates.add(name)
+            seen.add(digest)
+    return duplicates
+
+
+def filter_image_files(folder_path, names, min_width=0, min_height=0, min_aspect=0.0, max_aspect=0.0,
+                       skip_duplicates=False):
+    """
+    按分辨率、宽高比过滤并去重，保持 names 原有顺序。names 可以包含以 / 分隔的
+    子目录相对路径，每个子目录各用一个索引。结果会被缓存，names 为同一个列表
+    对象且相关索引都没有变化时直接返回。
+    """
+    folder_path = os.path.abspath(folder_path)
+    by_dir = defaultdict(list)
+    for name in names:
+        rel_dir, _, base = name.rpartition('/')
+        by_dir[rel_dir].append(base)
+    rows = {}
+    generations = []
+    for rel_dir in sorted(by_dir):
+        index = get_image_index(os.path.join(folder_path, rel_dir) if rel_dir else folder_path)
+        dir_rows = index.refresh()
+        generations.append((rel_dir, index.generation))
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        for base in by_dir[rel_dir]:
+            row = dir_rows.get(base)
+            if row is not None:
+                rows[prefix + base] = row
+
+    key = (folder_path, min_width, min_height, min_aspect, max_aspect, skip_duplicates)
+    with _filtered_lock:
+        cached = _filtered.get(key)
+    if cached is not None and cached[0] is names and cached[1] == generations:
+        return cached[2]
+
+    duplicates = duplicate_names(folder_path, names, rows) if skip_duplicates else ()
+    selected = []
+    for name in names:
+        row = rows.get(name)
+        if row is None or row[0] is None or name in duplicates:
+            continue
+        width, height = row[0], row[1]
+        if width < min_width or height < min_height:
+            continue
+        aspect = width / height if height else 0.0
+        if (min_aspect and aspect < min_aspect) or (max_aspect and aspect > max_aspect):
+            continue
+        selected.append(name)
+
+    with _filtered_lock:
+        _filtered[key] = (names, generations, selected)
+        _filtered.move_to_end(key)
+        while len(_filtered) > MAX_FILTERED_LISTS:
+            _filtered.popitem(last=False)
+    return selected
@@ -0,0 +1,226 @@
+import bisect
+import fnmatch
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+NUMBER_RE = re.compile(r'(\d+)')
+# 目录 mtime 距扫描时间小于该值时，同一时间戳内可能还有未看到的改动，下次仍重新扫描
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+# 增删文件数不超过该值时逐个二分插入/删除，否则整体归并
+BISECT_MAX_CHANGES = 256
+# 最多缓存的 (文件夹, 扩展名, 递归, 匹配规则) 组合数
+MAX_CACHED_FOLDERS = 64
+# 递归扫描时并行 scandir 的线程数
+SCAN_WORKERS = 8
+
+
+def natural_sort_key(filename):
+    """
+    自然排序键函数，将文件名中的数字部分按数值排序
+    例如: 1.png, 2.png, 10.png, 20.png, image1.png, image2.png, image10.png
+    """
+    def convert(text):
+        return int(text) if text.isdigit() else text.lower()
+
+    return [convert(c) for c in NUMBER_RE.split(filename)]
+
+
+def extension_suffixes(extensions):
+    """"png, JPG" -> ('.png', '.jpg')，可直接传给 str.endswith"""
+    return tuple(f'.{ext.strip().lower()}' for ext in extensions.split(','))
+
+
+def glob_patterns(patterns):
+    """"chapter*/ , *_mask.png" -> ('chapter*', '*_mask.png')"""
+    return tuple(p.strip().strip('/') for p in patterns.split(',') if p.strip().strip('/'))
+
+
+def matches_any(rel_path, patterns):
+    """
+    rel_path 为以 / 分隔的相对路径。规则同时匹配完整相对路径和最后一级名称，
+    因此 "thumbs" 能排除任意层级的 thumbs 目录；* 可以跨越目录。
+    """
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class DirectoryState:
+    """一次扫描得到的某个目录的内容：匹配扩展名的文件（相对路径）和子目录"""
+
+    def __init__(self, mtime_ns, scanned_ns, files, subdirs):
+        self.mtime_ns = mtime_ns
+        self.scanned_ns = scanned_ns
+        self.files = files
+        self.subdirs = subdirs
+
+    def is_current(self, mtime_ns):
+        return self.mtime_ns == mtime_ns and self.scanned_ns - self.mtime_ns >= RACY_WINDOW_NS
+
+
+def scan_directory(root, rel_dir, suffixes, recursive, exclude):
+    """用 os.scandir 扫描一个目录（跳过被排除的子目录和符号链接目录）"""
+    path = os.path.join(root, rel_dir) if rel_dir else root
+    # 先取 mtime 再扫描：扫描期间发生的改动会让下次的 mtime 对不上
+    mtime_ns = os.stat(path).st_mtime_ns
+    scanned_ns = time.time_ns()
+    files = set()
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    if not matches_any(rel_path, exclude):
+                        subdirs.append(rel_path)
+                    continue
+                if not entry.name.lower().endswith(suffixes) or not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            files.add(rel_path)
+    return DirectoryState(mtime_ns, scanned_ns, files, subdirs)
+
+
+def scan_tree(root, suffixes, recursive, exclude, previous):
+    """
+    扫描 root（recursive 时包括所有子目录），返回 ({相对目录: DirectoryState}, 是否有变化)。
+    previous 中 mtime 未变的目录直接复用，只重新 scandir 有变化的目录；
+    同一层的目录并行扫描。
+    """
+    def check(rel_dir):
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            if not rel_dir:
+                raise
+            return None
+        state = previous.get(rel_dir)
+        if state is not None and state.is_current(mtime_ns):
+            return state
+        try:
+            return scan_directory(root, rel_dir, suffixes, recursive, exclude)
+        except (FileNotFoundError, NotADirectoryError):
+            if not rel_dir:
+                raise
+            return None
+
+    if not recursive:
+        state = check("")
+        return {"": state}, state is not previous.get("")
+
+    directories = {}
+    changed = False
+    level = [""]
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        while level:
+            next_level = []
+            for rel_dir, state in zip(level, pool.map(check, level)):
+                if state is None:
+                    continue
+                changed = changed or state is not previous.get(rel_dir)
+                directories[rel_dir] = state
+                next_level.extend(state.subdirs)
+            level = next_level
+    changed = changed or len(directories) != len(previous)
+    return directories, changed
+
+
+class FolderListing:
+    """按自然排序的图片文件列表（相对路径）"""
+
+    def __init__(self, files, keys, names):
+        self.files = files
+        self.keys = keys
+        self.names = names
+
+    @classmethod
+    def build(cls, names):
+        # 文件名作为第二排序键，保证数字部分相同（如 01.png 与 1.png）时顺序也确定
+        pairs = sorted((natural_sort_key(name), name) for name in names)
+        return cls([name for _, name in pairs], [key for key, _ in pairs], names)
+
+    def updated(self, names):
+        """
+        把增删的文件合并进已排序列表，不对整个文件夹重新排序：少量变化用二分
+        查找定位插入/删除位置，大量变化时把新增部分排好序后与原列表归并
+        """
+        removed = self.names - names
+        added = names - self.names
+        if not removed and not added:
+            return self
+        files, keys = list(self.files), list(self.keys)
+        if len(removed) + len(added) <= BISECT_MAX_CHANGES:
+            for name in removed:
+                i = self._position(keys, files, natural_sort_key(name), name)
+                del files[i], keys[i]
+            for name in added:
+                key = natural_sort_key(name)
+                i = self._position(keys, files, key, name)
+                files.insert(i, name)
+                keys.insert(i, key)
+            return FolderListing(files, keys, names)
+
+        pairs = [(key, name) for key, name in zip(keys, files) if name not in removed]
+        # 两段各自有序，timsort 只做一次归并
+        pairs += sorted((natural_sort_key(name), name) for name in added)
+        pairs.sort()
+        return FolderListing([name for _, name in pairs], [key for key, _ in pairs], names)
+
+    @staticmethod
+    def _position(keys, files, key, name):
+        i = bisect.bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key and files[i] < name:
+            i += 1
+        return i
+
+
+class ImageListCache:
+    """
+    按 (文件夹, 扩展名, 递归, 匹配规则) 缓存排序后的图片列表，以各目录的 mtime
+    判断是否失效。目录有变化时只重新 scandir 该目录，并把增删的文件增量合并进
+    已有列表。
+    """
+
+    def __init__(self, max_folders=MAX_CACHED_FOLDERS):
+        self.max_folders = max_folders
+        self._lock = threading.Lock()
+        self._listings = OrderedDict()
+
+    def get(self, folder_path, extensions, recursive=False, include="", exclude=""):
+        """
+        返回排序后的文件列表（多个调用方共享，不要原地修改）。递归时为以 / 分隔的
+        相对路径；include 非空时只保留匹配其中任一规则的文件，exclude 匹配的文件
+        和目录会被跳过。
+        """
+        include, exclude = glob_patterns(include), glob_patterns(exclude)
+        key = (os.path.abspath(folder_path), extension_suffixes(extensions), recursive, include, exclude)
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is not None:
+                self._listings.move_to_end(key)
+        directories, listing = cached if cached is not None else ({}, None)
+
+        directories, changed = scan_tree(folder_path, key[1], recursive, exclude, directories)
+        if listing is None or changed:
+            names = set()
+            for state in directories.values():
+                names.update(state.files)
+            if include or exclude:
+                names = {name for name in names
+                         if (not include or matches_any(name, include)) and not matches_any(name, exclude)}
+            listing = FolderListing.build(names) if listing is None else listing.updated(names)
+
+        with self._lock:
+            self._listings[key] = (directories, listing)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_folders:
+                self._listings.popitem(last=False)
+        return listing.files
+
+
+IMAGE_LIST_CACHE = ImageListCache()
@@ -1,16 +1,39 @@
 import os
 import torch
-import numpy as np
-from PIL import Image
 from pathlib import Path
-import random
-import re
+import functools
+import time
+
+from .cursor_store import CURSOR_STORE
+from .fingerprint import file_fingerprint, folder_fingerprint
+from .image_batch import SIZE_POLICIES, stack_images
+from .image_cache import IMAGE_CACHE
+from .image_decode import load_image_tensor
+from .image_index import filter_image_files
+from .image_listing import IMAGE_LIST_CACHE, natural_sort_key
+from .image_prefetch import ImagePrefetcher
+from .image_sharding import shard_index, shard_size
+
+# 决定文件列表的可选输入（IS_CHANGED 需要据此算出同样的列表）
+LISTING_INPUTS = ("recursive", "include", "exclude",
+                  "min_width", "min_height", "min_aspect", "max_aspect", "skip_duplicates")
+
+def shard_label(shard_id=0, num_shards=1):
+    """计数器记录的分片，如 "0/4"；不分片时为空"""
+    return f"{shard_id}/{num_shards}" if num_shards > 1 else ""
+
+def cursor_key(folder_path, extensions, node_id, shard_id=0, num_shards=1):
+    """计数器的键：文件夹 + 扩展名 + 节点 id，多分片时再加上分片"""
+    ext_key = ",".join(ext.strip().lower() for ext in extensions.split(','))
+    key = f"{os.path.abspath(folder_path)}|{ext_key}|{node_id}"
+    if num_shards > 1:
+        key += f"|{shard_label(shard_id, num_shards)}"
+    return key
 
 class SequentialImageLoader:
-    counters = {}  # 使用类变量以保持状态
 
     def __init__(self):
-        pass
+        self.prefetcher = ImagePrefetcher()
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -20,106 +43,162 @@ class SequentialImageLoader:
                 "mode": (["fixed", "increment", "decrement", "random"], {"default": "increment"}),
                 "index": ("INT", {"default": 0, "min": 0, "max": 99999}),
                 "extensions": ("STRING", {"default": "png,jpg,jpeg,webp,bmp,tiff,gif", "multiline": False}),
+            },
+            "optional": {
+                # increment/decrement 模式下后台提前解码的图片数，0 表示关闭
+                "prefetch": ("INT", {"default": 4, "min": 0, "max": 64}),
+                # 每次执行加载的图片数：fixed/increment/decrement 取连续的文件，random 随机抽取
+                "batch_size": ("INT", {"default": 1, "min": 1, "max": 4096}),
+                "size_policy": (SIZE_POLICIES, {"default": "resize"}),
+                # 长边上限，大于 0 时以缩小后的分辨率解码（JPEG 使用 draft 缩放），0 为原尺寸
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8}),
+                # 递归扫描子目录，列表按相对路径自然排序
+                "recursive": ("BOOLEAN", {"default": False}),
+                # 逗号分隔的通配规则，匹配相对路径或文件/目录名，例如 chapter*, *_mask.png
+                "include": ("STRING", {"default": "", "multiline": False}),
+                "exclude": ("STRING", {"default": "", "multiline": False}),
+                # 以下条件通过文件夹的元数据索引过滤，不读取像素；0 表示不限制
+                "min_width": ("INT", {"default": 0, "min": 0, "max": 65535}),
+                "min_height": ("INT", {"default": 0, "min": 0, "max": 65535}),
+                "min_aspect": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.01}),
+                "max_aspect": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.01}),
+                # 内容完全相同的图片只保留排序最靠前的一张
+                "skip_duplicates": ("BOOLEAN", {"default": False}),
+                # 多个 ComfyUI 实例共用一个文件夹时，各实例设置不同的 shard_id 和相同的 num_shards/seed
+                "shard_id": ("INT", {"default": 0, "min": 0, "max": 4095}),
+                "num_shards": ("INT", {"default": 1, "min": 1, "max": 4096}),
+                # random 模式的打乱种子
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            },
+            "hidden": {
+                # 节点 id 用于区分同一文件夹上的多个加载器的计数器
+                "unique_id": "UNIQUE_ID",
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "STRING", "INT", "INT")
-    RETURN_NAMES = ("image", "filename", "current_index", "total_count")
+    # image/filename/current_index 为批次中的第一张；后三个输出逐张列出整个批次
+    RETURN_TYPES = ("IMAGE", "STRING", "INT", "INT", "IMAGE", "STRING", "INT")
+    RETURN_NAMES = ("image", "filename", "current_index", "total_count", "image_list", "filenames", "indices")
+    OUTPUT_IS_LIST = (False, False, False, False, True, True, True)
     FUNCTION = "load_image"
     CATEGORY = "dialogue_extractor"
     
     @classmethod
-    def IS_CHANGED(cls, folder_path, mode, index, extensions):
+    def IS_CHANGED(cls, folder_path, mode, index, extensions, batch_size=1, **kwargs):
         if mode in ["increment", "decrement", "random"]:
             return float("NaN")
-        return ""
+        # fixed 模式：文件夹增删文件或选中图片内容变化时才重新执行
+        folder_path = folder_path.strip()
+        options = {name: kwargs[name] for name in LISTING_INPUTS if name in kwargs}
+        try:
+            image_files = cls().get_image_files(folder_path, extensions, **options)
+        except (OSError, ValueError):
+            return folder_fingerprint(folder_path)
+        if not image_files:
+            return folder_fingerprint(folder_path)
+        shard_id, num_shards = kwargs.get("shard_id", 0), kwargs.get("num_shards", 1)
+        if not 0 <= shard_id < num_shards or not shard_size(len(image_files), shard_id, num_shards):
+            return folder_fingerprint(folder_path)
+        # 输出只取决于选中的文件和文件总数
+        selected_files = [image_files[shard_index(len(image_files), shard_id, num_shards, index + i)]
+                          for i in range(batch_size)]
+        fingerprints = [file_fingerprint(os.path.join(folder_path, f)) for f in selected_files]
+        return "|".join([str(len(image_files))] + fingerprints)
     
     def natural_sort_key(self, filename):
         """
         自然排序键函数，将文件名中的数字部分按数值排序
         例如: 1.png, 2.png, 10.png, 20.png, image1.png, image2.png, image10.png
         """
-        def convert(text):
-            return int(text) if text.isdigit() else text.lower()
-        
-        return [convert(c) for c in re.split(r'(\d+)', filename)]
+        return natural_sort_key(filename)
     
-    def get_image_files(self, folder_path: str, extensions: str) -> list:
+    def get_image_files(self, folder_path: str, extensions: str, recursive: bool = False, include: str = "",
+                        exclude: str = "", min_width: int = 0, min_height: int = 0, min_aspect: float = 0.0,
+                        max_aspect: float = 0.0, skip_duplicates: bool = False) -> list:
         if not os.path.exists(folder_path):
             raise ValueError(f"Folder path does not exist: {folder_path}")
         
-        ext_list = [ext.strip().lower() for ext in extensions.split(',')]
-        image_files = []
+        # 列表按目录 mtime 缓存，文件夹未变化时不再重新扫描和排序
+        image_files = IMAGE_LIST_CACHE.get(folder_path, extensions, recursive, include, exclude)
         
-        for file in os.listdir(folder_path):
-            if any(file.lower().endswith(f'.{ext}') for ext in ext_list):
-                image_files.append(file)
-        
-        # 使用自然排序
-        image_files.sort(key=self.natural_sort_key)
+        if min_width or min_height or min_aspect or max_aspect or skip_duplicates:
+            image_files = filter_image_files(folder_path, image_files, min_width, min_height,
+                                             min_aspect, max_aspect, skip_duplicates)
         
         return image_files
     
-    def load_image_as_tensor(self, file_path: str) -> torch.Tensor:
-        with Image.open(file_path) as img:
-            # 保持原始模式，支持 RGBA
-            if img.mode == 'RGBA':
-                img_array = np.array(img).astype(np.float32) / 255.0
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-                img_array = np.array(img).astype(np.float32) / 255.0
-            else:
-                img_array = np.array(img).astype(np.float32) / 255.0
-
-            # 转换为 ComfyUI 标准格式 (batch, height, width, channels)
-            img_tensor = torch.from_numpy(img_array)[None,]
-            return img_tensor
+    def load_image_as_tensor(self, file_path: str, max_side: int = 0) -> torch.Tensor:
+        return load_image_tensor(file_path, max_side)
     
-    def load_image(self, folder_path: str, mode: str, index: int, extensions: str):
+    def load_image(self, folder_path: str, mode: str, index: int, extensions: str, prefetch: int = 4,
+                   batch_size: int = 1, size_policy: str = "resize", max_side: int = 0,
+                   recursive: bool = False, include: str = "", exclude: str = "",
+                   min_width: int = 0, min_height: int = 0, min_aspect: float = 0.0, max_aspect: float = 0.0,
+                   skip_duplicates: bool = False, shard_id: int = 0, num_shards: int = 1, seed: int = 0,
+                   unique_id=None):
         folder_path = folder_path.strip()
         if not folder_path:
             raise ValueError("Folder path cannot be empty")
         
-        image_files = self.get_image_files(folder_path, extensions)
+        image_files = self.get_image_files(folder_path, extensions, recursive, include, exclude,
+                                           min_width, min_height, min_aspect, max_aspect, skip_duplicates)
         
         if not image_files:
             raise ValueError(f"No images found in folder: {folder_path}")
         
-        total_count = len(image_files)
+        if not 0 <= shard_id < num_shards:
+            raise ValueError(f"shard_id must be between 0 and {num_shards - 1}, got {shard_id}")
+        
+        # 多个实例读同一个文件夹时，各自只处理自己的分片；total_count 为本分片的图片数
+        total_count = shard_size(len(image_files), shard_id, num_shards)
+        if not total_count:
+            raise ValueError(f"No images in shard {shard_id} of {num_shards} for folder: {folder_path}")
         
         if mode == "fixed":
-            current_index = index % total_count
+            positions = [index + i for i in range(batch_size)]
         
-        elif mode == "increment":
-            # 初始化或获取计数器
-            if folder_path not in SequentialImageLoader.counters:
-                SequentialImageLoader.counters[folder_path] = 0
+        else:
+            # 获取并推进持久化的计数器，每次前进一个批次；计数器不取模，用来区分 random 模式的 epoch
+            counter = CURSOR_STORE.advance(
+                cursor_key(folder_path, extensions, unique_id, shard_id, num_shards),
+                os.path.abspath(folder_path), extensions, str(unique_id), batch_size,
+                shard_label(shard_id, num_shards))
+            
+            if mode == "decrement":
+                # index 作为偏移量，decrement 模式下反向计数
+                positions = [index - counter - i for i in range(batch_size)]
             else:
-                SequentialImageLoader.counters[folder_path] = (SequentialImageLoader.counters[folder_path] + 1) % total_count
-
-            # index 作为偏移量，始终影响结果
-            current_index = (index + SequentialImageLoader.counters[folder_path]) % total_count
+                # index 作为偏移量，始终影响结果
+                positions = [index + counter + i for i in range(batch_size)]
         
-        elif mode == "decrement":
-            # 初始化或获取计数器
-            if folder_path not in SequentialImageLoader.counters:
-                SequentialImageLoader.counters[folder_path] = 0
-            else:
-                SequentialImageLoader.counters[folder_path] = (SequentialImageLoader.counters[folder_path] + 1) % total_count
-
-            # index 作为偏移量，decrement 模式下反向计数
-            current_index = (index - SequentialImageLoader.counters[folder_path]) % total_count
+        # random 模式按 seed 打乱：每个 epoch 是整个文件夹的一个排列，同一 epoch 内不会重复
+        order_seed = seed if mode == "random" else None
+        batch_indices = [shard_index(len(image_files), shard_id, num_shards, p, order_seed) for p in positions]
         
-        elif mode == "random":
-            current_index = random.randint(0, total_count - 1)
+        selected_files = [image_files[i] for i in batch_indices]
+        file_paths = [os.path.join(folder_path, f) for f in selected_files]
+        filenames = [Path(f).stem for f in selected_files]
         
-        selected_file = image_files[current_index]
-        file_path = os.path.join(folder_path, selected_file)
-        filename = Path(selected_file).stem
+        # 批量时在线程池中并行解码；fixed 模式会反复读同一批图片，经过共享的解码缓存
+        decode = functools.partial(self.load_image_as_tensor, max_side=max_side)
+        if mode == "fixed":
+            decode = functools.partial(IMAGE_CACHE.get, mode=f"auto:{max_side}", decode=decode)
+        images = self.prefetcher.take_many(file_paths, decode)
+        image_tensor, image_list = stack_images(images, size_policy)
         
-        image_tensor = self.load_image_as_tensor(file_path)
+        if mode != "fixed" and prefetch > 0:
+            # 按计数方向预取下一批之后的图片
+            step = -1 if mode == "decrement" else 1
+            upcoming = []
+            for ahead in range(batch_size, batch_size + min(prefetch, total_count)):
+                next_index = shard_index(len(image_files), shard_id, num_shards,
+                                         index + step * (counter + ahead), order_seed)
+                upcoming.append(os.path.join(folder_path, image_files[next_index]))
+            self.prefetcher.schedule((folder_path, extensions, mode, max_side), upcoming, decode)
+        else:
+            self.prefetcher.cancel()
         
-        return (image_tensor, filename, current_index, total_count)
+        return (image_tensor, filenames[0], batch_indices[0], total_count, image_list, filenames, batch_indices)
 
 class ImagePathLoader:
     """从指定路径加载单个图片"""
@@ -129,6 +208,10 @@ class ImagePathLoader:
         return {
             "required": {
                 "image_path": ("STRING", {"default": "", "multiline": False}),
+            },
+            "optional": {
+                # 长边上限，大于 0 时以缩小后的分辨率解码（JPEG 使用 draft 缩放），0 为原尺寸
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8}),
             }
         }
 
@@ -137,7 +220,15 @@ class ImagePathLoader:
     FUNCTION = "load_image"
     CATEGORY = "dialogue_extractor"
 
-    def load_image(self, image_path: str):
+    @classmethod
+    def IS_CHANGED(cls, image_path, max_side=0):
+        return file_fingerprint(image_path.strip())
+
+    @staticmethod
+    def decode_image(image_path: str, max_side: int = 0) -> torch.Tensor:
+        return load_image_tensor(image_path, max_side)
+
+    def load_image(self, image_path: str, max_side: int = 0):
         image_path = image_path.strip()
         if not image_path:
             raise ValueError("Image path cannot be empty")
@@ -152,29 +243,64 @@ class ImagePathLoader:
         filename = Path(image_path).stem
 
         try:
-            with Image.open(image_path) as img:
-                # 保持原始模式，支持 RGBA
-                if img.mode == 'RGBA':
-                    img_array = np.array(img).astype(np.float32) / 255.0
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                    img_array = np.array(img).astype(np.float32) / 255.0
-                else:
-                    img_array = np.array(img).astype(np.float32) / 255.0
-
-                # 转换为 ComfyUI 标准格式 (batch, height, width, channels)
-                img_tensor = torch.from_numpy(img_array)[None,]
-
-                return (img_tensor, filename)
+            # 同一张参考图会被反复加载，解码结果放在进程内共享缓存中
+            decode = functools.partial(self.decode_image, max_side=max_side)
+            img_tensor = IMAGE_CACHE.get(image_path, f"auto:{max_side}", decode)
+            return (img_tensor, filename)
         except Exception as e:
             raise ValueError(f"Failed to load image from {image_path}: {str(e)}")
 
+class ImageCursorManager:
+    """查看或重置 Sequential Image Loader 保存的计数器"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "action": (["inspect", "reset"], {"default": "inspect"}),
+            },
+            "optional": {
+                # 只处理文件夹路径包含该字符串的计数器，留空为全部
+                "folder_filter": ("STRING", {"default": "", "multiline": False}),
+                # 只处理该分片（如 0/4）的计数器，留空为全部
+                "shard_filter": ("STRING", {"default": "", "multiline": False}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "manage"
+    CATEGORY = "dialogue_extractor"
+    OUTPUT_NODE = True
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        return float("NaN")
+
+    def manage(self, action: str, folder_filter: str = "", shard_filter: str = ""):
+        folder_filter, shard_filter = folder_filter.strip(), shard_filter.strip()
+        if action == "reset":
+            removed = CURSOR_STORE.reset(folder_filter, shard_filter)
+            return (f"Reset {removed} cursor(s)",)
+        rows = CURSOR_STORE.inspect(folder_filter, shard_filter)
+        if not rows:
+            return ("No cursors",)
+        lines = []
+        for folder, extensions, node_id, shard, next_counter, claimed, updated in rows:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated))
+            shard_text = f" shard {shard}" if shard else ""
+            claimed_text = f", batch {claimed} in progress" if claimed is not None else ""
+            lines.append(f"{folder} [{extensions}] node {node_id}{shard_text}: next {next_counter}{claimed_text} ({when})")
+        return ("\n".join(lines),)
+
 NODE_CLASS_MAPPINGS = {
     "SequentialImageLoader": SequentialImageLoader,
     "ImagePathLoader": ImagePathLoader,
+    "ImageCursorManager": ImageCursorManager,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "SequentialImageLoader": "Sequential Image Loader",
     "ImagePathLoader": "Image Path Loader",
+    "ImageCursorManager": "Image Cursor Manager",
 }
\ No newline at end of file
@@ -0,0 +1,131 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 所有加载器共用的解码线程数（批量加载和后台预取共用）
+DECODE_WORKERS = min(8, os.cpu_count() or 1)
+# 每个加载器预取结果（含正在解码的估算大小）占用内存的上限
+PREFETCH_MAX_BYTES = 1024 * 1024 * 1024
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="image_decode")
+        return _executor
+
+
+def file_stat_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def tensor_nbytes(tensor):
+    return tensor.element_size() * tensor.nelement()
+
+
+class PrefetchEntry:
+    def __init__(self, stat_key, future):
+        self.stat_key = stat_key
+        self.future = future
+        self.nbytes = None
+
+
+class ImagePrefetcher:
+    """
+    在后台提前解码接下来要加载的图片。
+
+    schedule() 传入接下来会用到的文件路径（按使用顺序），不再需要的预取会被取消；
+    key（文件夹、扩展名、模式）变化时全部取消。take() 优先使用预取结果，
+    没有预取或文件已被修改时同步解码。
+    """
+
+    def __init__(self, max_bytes=PREFETCH_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key = None
+        self._entries = {}
+        # 最近一张图解码后的大小，用来估算正在解码的图片占用
+        self._size_hint = 0
+
+    def take(self, file_path, decode):
+        return self.take_many([file_path], decode)[0]
+
+    def take_many(self, file_paths, decode):
+        """
+        按顺序返回多张图片：优先用预取结果，其余在线程池里并行解码。
+        只在调用线程里等待，避免线程池内的任务互相等待而卡死。
+        """
+        futures = {}
+        for file_path in file_paths:
+            if file_path in futures:
+                continue
+            with self._lock:
+                entry = self._entries.pop(file_path, None)
+            if entry is not None and not entry.future.cancelled() and entry.stat_key == file_stat_key(file_path):
+                futures[file_path] = (entry.future, True)
+            elif len(file_paths) == 1:
+                futures[file_path] = (None, False)
+            else:
+                futures[file_path] = (get_executor().submit(decode, file_path), False)
+
+        results = {}
+        for file_path, (future, prefetched) in futures.items():
+            if future is None:
+                results[file_path] = decode(file_path)
+                continue
+            try:
+                results[file_path] = future.result()
+            except Exception:
+                if not prefetched:
+                    raise
+                # 预取失败时重新同步解码，以同步加载的报错为准
+                results[file_path] = decode(file_path)
+        return [results[file_path] for file_path in file_paths]
+
+    def schedule(self, key, file_paths, decode):
+        with self._lock:
+            if key != self._key:
+                self._cancel_locked()
+                self._key = key
+            wanted = set(file_paths)
+            for file_path in list(self._entries):
+                if file_path not in wanted:
+                    self._entries.pop(file_path).future.cancel()
+
+            reserved = sum(entry.nbytes if entry.nbytes is not None else self._size_hint
+                           for entry in self._entries.values())
+            for file_path in file_paths:
+                if file_path in self._entries:
+                    continue
+                if reserved + self._size_hint > self.max_bytes:
+                    break
+                entry = PrefetchEntry(file_stat_key(file_path), None)
+                entry.future = get_executor().submit(self._decode, entry, file_path, decode)
+                self._entries[file_path] = entry
+                reserved += self._size_hint
+
+    def _decode(self, entry, file_path, decode):
+        tensor = decode(file_path)
+        entry.nbytes = tensor_nbytes(tensor)
+        with self._lock:
+            self._size_hint = entry.nbytes
+        return tensor
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+            self._key = None
+
+    def _cancel_locked(self):
+        # 已经开始解码的任务无法中断，结果会被直接丢弃
+        for entry in self._entries.values():
+            entry.future.cancel()
+        self._entries.clear()
@@ -0,0 +1,28 @@
+import functools
+import random
+
+
+def shard_size(total, shard_id, num_shards):
+    """第 shard_id 个分片中的图片数（分片按位置交错划分：shard_id, shard_id + num_shards, ...）"""
+    return len(range(shard_id, total, num_shards))
+
+
+@functools.lru_cache(maxsize=8)
+def shard_order(total, shard_id, num_shards, seed=None, epoch=0):
+    """
+    分片内依次访问的全局索引。seed 为 None 时按原顺序；否则每个 epoch 用
+    (seed, epoch) 生成整个列表的同一个排列，再交错切分，所以同一 epoch 内
+    各分片互不重叠且合起来正好覆盖全部图片。返回值被缓存共享，不要修改。
+    """
+    if seed is None:
+        return range(shard_id, total, num_shards)
+    order = list(range(total))
+    # 字符串种子经 sha512 展开，不同进程、不同机器上得到相同的排列
+    random.Random(f"{seed}:{epoch}").shuffle(order)
+    return order[shard_id::num_shards]
+
+
+def shard_index(total, shard_id, num_shards, position, seed=None):
+    """分片内第 position 步（可以超过分片大小或为负数）对应的全局索引"""
+    epoch, offset = divmod(position, shard_size(total, shard_id, num_shards))
+    return shard_order(total, shard_id, num_shards, seed, epoch if seed is not None else 0)[offset]
@@ -0,0 +1,180 @@
+import atexit
+import io
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 等待写入的图片数上限，队列满时保存节点阻塞等待（背压），避免未写出的图片占满内存
+WRITER_QUEUE_SIZE = int(os.environ.get("DIALOGUE_EXTRACTOR_WRITER_QUEUE", "64"))
+# 后台编码/写入线程数；PNG/JPEG 编码时 Pillow 会释放 GIL
+WRITER_THREADS = min(4, os.cpu_count() or 1)
+# 状态节点中保留的最近错误数
+MAX_RECENT_ERRORS = 100
+# 保存节点并行编码的默认线程数（encode_workers 为 0 时）
+ENCODE_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def encode_image(img, extension, save_kwargs):
+    """把图片按扩展名对应的格式编码为字节，用于写入归档分片"""
+    buf = io.BytesIO()
+    img.save(buf, format=Image.registered_extensions()[f".{extension.lower()}"], **save_kwargs)
+    return buf.getvalue()
+
+
+def save_atomic(img, full_path, save_kwargs):
+    """
+    先写临时文件再改名：读取方不会看到写了一半的图片，同一批中重名的图片
+    被多个线程同时保存时，也只会留下其中一张完整的图片
+    """
+    directory, name = os.path.split(full_path)
+    # 临时文件不带图片扩展名，不会被文件夹加载器读到；编码格式按最终文件名确定。
+    # 文件名带上进程号和线程号，多个进程写同一个文件夹时也不会冲突
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    image_format = Image.registered_extensions().get(os.path.splitext(name)[1].lower())
+    try:
+        img.save(tmp_path, format=image_format, **save_kwargs)
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def resolve_workers(requested, count):
+    """实际使用的编码线程数：requested 为 0 时自动选择，且不超过图片数"""
+    return max(1, min(requested or ENCODE_WORKERS, count))
+
+
+def map_in_order(fn, items, workers):
+    """
+    并行执行 fn(item)，按 items 的顺序返回结果。用线程而不是进程：Pillow 编码、
+    numpy 运算时会释放 GIL，也不必在进程间复制图片。
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image_encode") as pool:
+        return list(pool.map(fn, items))
+
+
+def timing_summary(timings, workers, wall_seconds, encode_label="encode", convert_seconds=0.0):
+    """
+    timings 为每张图的 (转换耗时, 编码耗时)，convert_seconds 为整批转换的耗时，
+    汇总成 UI 中显示的一条记录
+    """
+    return {
+        "images": len(timings),
+        "workers": workers,
+        "convert_seconds": round(convert_seconds + sum(t[0] for t in timings), 4),
+        f"{encode_label}_seconds": round(sum(t[1] for t in timings), 4),
+        "wall_seconds": round(wall_seconds, 4),
+    }
+
+
+class WriteJob:
+    def __init__(self, full_path, img, save_kwargs):
+        self.full_path = full_path
+        self.img = img
+        self.save_kwargs = save_kwargs
+
+
+class BackgroundImageWriter:
+    """
+    在后台线程中编码并写入图片。submit() 立即返回，队列满时阻塞；
+    写入先写临时文件再改名，读取方不会看到写了一半的图片。
+    写入失败的错误保存下来，由之后的保存节点或状态节点报告。
+    进程退出前会等待队列中的图片全部写完。
+    """
+
+    def __init__(self, max_queue=WRITER_QUEUE_SIZE, threads=WRITER_THREADS):
+        self.max_queue = max_queue
+        self.threads = threads
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._workers = []
+        # 已提交但还没写完的路径及其任务数，计数器据此跳过已被占用的文件名
+        self._pending = {}
+        self._errors = []
+        self._recent_errors = deque(maxlen=MAX_RECENT_ERRORS)
+        self.written = 0
+        self.failed = 0
+        self.blocked_seconds = 0.0
+        atexit.register(self.flush)
+
+    def _start_locked(self):
+        while len(self._workers) < self.threads:
+            worker = threading.Thread(target=self._run, name="image_writer", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, full_path, img, save_kwargs):
+        with self._lock:
+            self._start_locked()
+            self._pending[full_path] = self._pending.get(full_path, 0) + 1
+        job = WriteJob(full_path, img, save_kwargs)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            start = time.perf_counter()
+            self._queue.put(job)
+            with self._lock:
+                self.blocked_seconds += time.perf_counter() - start
+
+    def pending_names(self, directory):
+        """directory 中已提交但还没写完的文件名"""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            return {os.path.basename(p) for p in self._pending if os.path.dirname(os.path.abspath(p)) == directory}
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._write(job)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                    error = f"{job.full_path}: {e}"
+                    self._errors.append(error)
+                    self._recent_errors.append(error)
+            else:
+                with self._lock:
+                    self.written += 1
+            finally:
+                with self._lock:
+                    if self._pending[job.full_path] > 1:
+                        self._pending[job.full_path] -= 1
+                    else:
+                        del self._pending[job.full_path]
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(job):
+        save_atomic(job.img, job.full_path, job.save_kwargs)
+
+    def flush(self):
+        """等待已提交的图片全部写完"""
+        self._queue.join()
+
+    def take_errors(self):
+        """返回并清空上次调用以来的写入错误"""
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def status(self):
+        with self._lock:
+            return {
+                "pending": sum(self._pending.values()),
+                "written": self.written,
+                "failed": self.failed,
+                "blocked_seconds": self.blocked_seconds,
+                "recent_errors": list(self._recent_errors),
+            }
+
+
+IMAGE_WRITER = BackgroundImageWriter()
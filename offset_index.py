@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+
+from .compressed_source import DecompressedStream, detect_compression, read_ranges, remember_checkpoints
+from .dialogue_groups import (GROUP_CACHE, decode_group, file_signature, open_source, parse_group,
+                              prefix_probe, resume_point, scan_key, scan_stream)
+
+INDEX_MAGIC = b"DLGIDX01"
+INDEX_VERSION = 1
+SPAN = struct.Struct("<QQ")
+TRAILER = struct.Struct("<Q8s")
+
+CACHE_DIR = os.environ.get("DIALOGUE_EXTRACTOR_CACHE_DIR") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Files at least this large are served from the on-disk offset index instead of
+# being parsed into memory
+OFFSET_INDEX_MIN_SIZE = 32 * 1024 * 1024
+
+
+def needs_offset_index(file_path):
+    """Huge and compressed files are served from the offset index, never parsed into memory."""
+    return os.path.getsize(file_path) >= OFFSET_INDEX_MIN_SIZE or detect_compression(file_path) is not None
+
+
+def index_path_for(file_path, load_mode, custom_separator, suffix=".idx"):
+    key = "\0".join([os.path.abspath(file_path), load_mode, custom_separator or ""])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(CACHE_DIR, f"{digest}{suffix}")
+
+
+def iter_groups(file_path, load_mode, custom_separator="---"):
+    """Yield every group's text in order, streaming plain and compressed files alike."""
+    scan_mode, separator = scan_key(load_mode, custom_separator)
+    compression = detect_compression(file_path)
+    if compression is not None:
+        source = DecompressedStream(file_path, compression)
+    else:
+        source = open(file_path, 'rb')
+    with source:
+        for _, _, raw in scan_stream(source, scan_mode, separator):
+            yield decode_group(raw)
+
+
+def group_count(file_path, load_mode, custom_separator="---"):
+    if needs_offset_index(file_path):
+        return get_offset_index(file_path, load_mode, custom_separator).count
+    return len(GROUP_CACHE.get(file_path, load_mode, custom_separator))
+
+
+def fetch_groups(file_path, load_mode, custom_separator, group_indices):
+    """(title, content, full_group) for each index, from whichever cache fits the file."""
+    if needs_offset_index(file_path):
+        index = get_offset_index(file_path, load_mode, custom_separator)
+        return index.parsed_groups(file_path, group_indices, load_mode)
+    parsed = GROUP_CACHE.get(file_path, load_mode, custom_separator)
+    return [(parsed.titles[i], parsed.contents[i], parsed.groups[i]) for i in group_indices]
+
+
+class OffsetIndex:
+    """
+    On-disk list of group byte spans for one (file, load_mode, separator).
+
+    Layout: count packed <QQ spans, a JSON header, then the header length and
+    magic. Lookups read a single span, so memory use does not grow with the file.
+    """
+
+    def __init__(self, index_path, header):
+        self.index_path = index_path
+        self.header = header
+        self.count = header["count"]
+
+    @classmethod
+    def read(cls, index_path):
+        with open(index_path, 'rb') as f:
+            f.seek(-TRAILER.size, os.SEEK_END)
+            header_len, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"Not a dialogue offset index: {index_path}")
+            f.seek(-(TRAILER.size + header_len), os.SEEK_END)
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported offset index version: {index_path}")
+        return cls(index_path, header)
+
+    @classmethod
+    def build(cls, file_path, index_path, load_mode, custom_separator, previous=None):
+        """
+        Write the index for file_path. If `previous` indexes an older version the
+        file has only been appended to since, its spans are kept and only the new
+        tail is scanned.
+        """
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        compression = detect_compression(file_path)
+        if compression is not None:
+            return cls._build_compressed(file_path, index_path, tmp_path, load_mode, custom_separator, compression)
+        with open_source(file_path) as buf:
+            path, mtime_ns, size = file_signature(file_path)
+            resume = None
+            if previous is not None and previous.header["source_size"] < size \
+                    and prefix_probe(buf, previous.header["source_size"]) == previous.header.get("probe"):
+                resume = resume_point(buf, previous.tail_spans(), previous.count,
+                                      load_mode, custom_separator)
+            if resume is not None:
+                count, resume_at = resume
+                shutil.copyfile(previous.index_path, tmp_path)
+                out = open(tmp_path, 'r+b')
+                out.truncate(count * SPAN.size)
+                out.seek(0, os.SEEK_END)
+            else:
+                count, resume_at = 0, None
+                out = open(tmp_path, 'wb')
+            with out, open(file_path, 'rb') as source:
+                # Stream the source in chunks rather than walking the whole mapping
+                source.seek(resume_at or 0)
+                for start, end, _ in scan_stream(source, load_mode, custom_separator, resume_at):
+                    out.write(SPAN.pack(start, end))
+                    count += 1
+                header = {
+                    "version": INDEX_VERSION,
+                    "source_path": path,
+                    "source_mtime_ns": mtime_ns,
+                    "source_size": size,
+                    "load_mode": load_mode,
+                    "custom_separator": custom_separator,
+                    "count": count,
+                    "probe": prefix_probe(buf, size),
+                }
+                cls._write_header(out, header)
+        os.replace(tmp_path, index_path)
+        return cls(index_path, header)
+
+    @classmethod
+    def _build_compressed(cls, file_path, index_path, tmp_path, load_mode, custom_separator, compression):
+        """
+        Spans of a compressed file are offsets into the decompressed stream. The
+        boundaries where decompression can restart from scratch are stored too,
+        so later lookups don't have to start from the beginning of the file.
+        """
+        signature = file_signature(file_path)
+        path, mtime_ns, size = signature
+        count = 0
+        with open(tmp_path, 'wb') as out, \
+                DecompressedStream(file_path, compression, record=True) as source:
+            for start, end, _ in scan_stream(source, load_mode, custom_separator):
+                out.write(SPAN.pack(start, end))
+                count += 1
+            header = {
+                "version": INDEX_VERSION,
+                "source_path": path,
+                "source_mtime_ns": mtime_ns,
+                "source_size": size,
+                "load_mode": load_mode,
+                "custom_separator": custom_separator,
+                "count": count,
+                "compression": compression,
+                "restart_points": [[d, c] for d, c, snapshot in source.checkpoints if snapshot is None],
+            }
+            cls._write_header(out, header)
+        remember_checkpoints(signature, source.checkpoints)
+        os.replace(tmp_path, index_path)
+        return cls(index_path, header)
+
+    @staticmethod
+    def _write_header(out, header):
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        out.write(encoded)
+        out.write(TRAILER.pack(len(encoded), INDEX_MAGIC))
+
+    def matches(self, signature):
+        path, mtime_ns, size = signature
+        return (self.header["source_path"] == path
+                and self.header["source_mtime_ns"] == mtime_ns
+                and self.header["source_size"] == size)
+
+    def span(self, group_index):
+        with open(self.index_path, 'rb') as f:
+            f.seek(group_index * SPAN.size)
+            return SPAN.unpack(f.read(SPAN.size))
+
+    def tail_spans(self):
+        return [self.span(i) for i in range(max(0, self.count - 2), self.count)]
+
+    def group(self, file_path, group_index):
+        return self.groups(file_path, [group_index])[0]
+
+    def groups(self, file_path, group_indices):
+        """Decode several groups, mapping (or decompressing) the source only once."""
+        spans = []
+        with open(self.index_path, 'rb') as index_file:
+            for group_index in group_indices:
+                index_file.seek(group_index * SPAN.size)
+                spans.append(SPAN.unpack(index_file.read(SPAN.size)))
+        compression = self.header.get("compression")
+        if compression is not None:
+            signature = (self.header["source_path"], self.header["source_mtime_ns"], self.header["source_size"])
+            raw_groups = read_ranges(file_path, compression, signature,
+                                     self.header["restart_points"], spans)
+            return [decode_group(raw) for raw in raw_groups]
+        with open_source(file_path) as buf:
+            return [decode_group(buf[start:end]) for start, end in spans]
+
+    def parsed_groups(self, file_path, group_indices, load_mode):
+        """Like parsed_group for several groups."""
+        results = []
+        for group_index, group in zip(group_indices, self.groups(file_path, group_indices)):
+            title, content, _ = parse_group(group, group_index, load_mode)
+            results.append((title, content, group))
+        return results
+
+    def parsed_group(self, file_path, group_index, load_mode):
+        """(title, content, full_group) for one group, decoded straight from the source."""
+        group = self.group(file_path, group_index)
+        title, content, _ = parse_group(group, group_index, load_mode)
+        return title, content, group
+
+
+_index_lock = threading.Lock()
+_open_indexes = {}
+
+
+def get_offset_index(file_path, load_mode, custom_separator="---"):
+    """Return an up-to-date OffsetIndex for the file, building or extending it if needed."""
+    scan_mode, separator = scan_key(load_mode, custom_separator)
+    index_path = index_path_for(file_path, scan_mode, separator)
+    signature = file_signature(file_path)
+
+    with _index_lock:
+        index = _open_indexes.get(index_path)
+        if index is None or not index.matches(signature):
+            # Another process may already have refreshed the sidecar
+            index = None
+            if os.path.exists(index_path):
+                try:
+                    index = OffsetIndex.read(index_path)
+                except (OSError, ValueError):
+                    index = None
+            if index is None or not index.matches(signature):
+                index = OffsetIndex.build(file_path, index_path, scan_mode, separator, previous=index)
+            _open_indexes[index_path] = index
+        return index
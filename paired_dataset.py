@@ -0,0 +1,350 @@
+import functools
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .cursor_store import CURSOR_STORE
+from .dialogue_groups import GROUP_CACHE, LOAD_MODES, file_signature, parse_group
+from .fingerprint import file_fingerprint, folder_fingerprint
+from .image_batch import SIZE_POLICIES, stack_images
+from .image_cache import IMAGE_CACHE
+from .image_decode import load_image_tensor
+from .image_listing import IMAGE_LIST_CACHE
+from .image_loader import cursor_key
+from .image_prefetch import ImagePrefetcher, get_executor
+from .image_sharding import shard_index
+from .offset_index import fetch_groups, group_count, iter_groups, needs_offset_index
+
+JOIN_MODES = ["stem", "index", "mapping"]
+# 缓存的配对结果个数
+MAX_CACHED_JOINS = 8
+# 报告中每类问题最多列出的名称数
+REPORT_MAX_NAMES = 20
+
+
+def group_titles(file_path, load_mode, custom_separator):
+    """每组的 (标题, 是否识别出标题)；大文件和压缩文件流式解析，不整体读入内存"""
+    if needs_offset_index(file_path):
+        titles = []
+        for i, group in enumerate(iter_groups(file_path, load_mode, custom_separator)):
+            title, _, has_title = parse_group(group, i, load_mode)
+            titles.append((title, has_title))
+        return titles
+    parsed = GROUP_CACHE.get(file_path, load_mode, custom_separator)
+    return [(title, i not in parsed.untitled) for i, title in enumerate(parsed.titles)]
+
+
+def read_mapping(mapping_path):
+    """
+    读取映射文件，返回 [(图片, 对话组)]。.json 为 {图片: 组} 对象或 [[图片, 组], ...]
+    列表；其他文件每行一对，用制表符或第一个逗号分隔，空行和 # 开头的行忽略。
+    图片可以写相对路径、文件名或不含扩展名的文件名，组可以写序号或标题。
+    """
+    with open(mapping_path, 'r', encoding='utf-8') as f:
+        if mapping_path.lower().endswith('.json'):
+            data = json.load(f)
+            items = data.items() if isinstance(data, dict) else data
+            return [(str(image).strip(), str(group).strip()) for image, group in items]
+        entries = []
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            image, sep, group = line.partition('\t') if '\t' in line else line.partition(',')
+            if sep:
+                entries.append((image.strip(), group.strip()))
+        return entries
+
+
+def format_names(label, names):
+    names = list(names)
+    shown = ", ".join(str(name) for name in names[:REPORT_MAX_NAMES])
+    if len(names) > REPORT_MAX_NAMES:
+        shown += f", ... {len(names) - REPORT_MAX_NAMES} more"
+    return f"{len(names)} {label}: {shown}"
+
+
+class PairedJoin:
+    """配对结果：images[i] 与第 groups[i] 组对话配对，report 为不匹配情况的说明"""
+
+    def __init__(self, images, groups, report):
+        self.images = images
+        self.groups = groups
+        self.report = report
+
+    @classmethod
+    def build(cls, image_files, file_path, load_mode, custom_separator, join_mode, mapping_path=""):
+        problems = []
+        if join_mode == "index":
+            total_groups = group_count(file_path, load_mode, custom_separator)
+            count = min(len(image_files), total_groups)
+            images, groups = list(image_files[:count]), list(range(count))
+            if len(image_files) > count:
+                problems.append(format_names("image(s) without dialogue", image_files[count:]))
+            if total_groups > count:
+                problems.append(f"{total_groups - count} dialogue group(s) without image: {count}..{total_groups - 1}")
+            return cls(images, groups, cls._report(join_mode, images, len(image_files), total_groups, problems))
+
+        # 图片可以用相对路径、文件名或不含扩展名的文件名来引用，同名时排序靠前的优先
+        by_name = {}
+        for image in image_files:
+            base = image.rsplit('/', 1)[-1]
+            for name in (image, base, Path(base).stem):
+                by_name.setdefault(name, image)
+
+        entries = read_mapping(mapping_path) if join_mode == "mapping" else \
+            [(image, Path(image).stem) for image in image_files]
+        titles = None
+        if join_mode == "stem" or any(not group.isdigit() for _, group in entries):
+            titles = group_titles(file_path, load_mode, custom_separator)
+            total_groups = len(titles)
+        else:
+            total_groups = group_count(file_path, load_mode, custom_separator)
+
+        by_title = {}
+        shared_titles = set()
+        for i, (title, has_title) in enumerate(titles or ()):
+            if not has_title:
+                continue
+            if title in by_title:
+                shared_titles.add(title)
+            else:
+                by_title[title] = i
+
+        images, groups = [], []
+        unknown_images, unknown_groups, ambiguous = [], [], []
+        for image_key, group_key in entries:
+            image = by_name.get(image_key)
+            if image is None:
+                unknown_images.append(image_key)
+                continue
+            # 先按标题匹配，没有该标题时纯数字当作组序号
+            group = by_title.get(group_key)
+            if group is None and group_key.isdigit() and int(group_key) < total_groups:
+                group = int(group_key)
+            if group is None:
+                unknown_groups.append(image if join_mode == "stem" else group_key)
+                continue
+            if group_key in shared_titles:
+                ambiguous.append(group_key)
+            images.append(image)
+            groups.append(group)
+
+        if join_mode == "mapping":
+            if unknown_images:
+                problems.append(format_names("mapped image(s) not found", unknown_images))
+            if unknown_groups:
+                problems.append(format_names("mapped group(s) not found", unknown_groups))
+            paired = set(images)
+            unpaired = [image for image in image_files if image not in paired]
+            if unpaired:
+                problems.append(format_names("image(s) without dialogue", unpaired))
+        elif unknown_groups:
+            problems.append(format_names("image(s) without dialogue", unknown_groups))
+        used = set(groups)
+        if len(used) < total_groups:
+            problems.append(format_names("dialogue group(s) without image",
+                                         (i for i in range(total_groups) if i not in used)))
+        if ambiguous:
+            problems.append(format_names("title(s) shared by several groups, first group used",
+                                         sorted(set(ambiguous))))
+        return cls(images, groups, cls._report(join_mode, images, len(image_files), total_groups, problems))
+
+    @staticmethod
+    def _report(join_mode, images, total_images, total_groups, problems):
+        lines = [f"Paired {len(images)} of {total_images} image(s) with {total_groups} dialogue group(s) "
+                 f"(join: {join_mode})"]
+        return "\n".join(lines + problems)
+
+
+_joins_lock = threading.Lock()
+_joins = OrderedDict()
+
+
+def get_join(image_files, folder_path, file_path, load_mode, custom_separator, join_mode, mapping_path=""):
+    """
+    配对结果按 (文件夹, 对话文件版本, 映射文件版本, 参数) 缓存；image_files 为
+    同一个列表对象（文件夹没有变化）且两个文件都没有修改时直接返回。
+    """
+    mapping_signature = file_signature(mapping_path) if join_mode == "mapping" else None
+    key = (os.path.abspath(folder_path), os.path.abspath(file_path), load_mode, custom_separator,
+           join_mode, mapping_path)
+    signatures = (file_signature(file_path), mapping_signature)
+    with _joins_lock:
+        cached = _joins.get(key)
+    if cached is not None and cached[0] is image_files and cached[1] == signatures:
+        return cached[2]
+
+    join = PairedJoin.build(image_files, file_path, load_mode, custom_separator, join_mode, mapping_path)
+    with _joins_lock:
+        _joins[key] = (image_files, signatures, join)
+        _joins.move_to_end(key)
+        while len(_joins) > MAX_CACHED_JOINS:
+            _joins.popitem(last=False)
+    return join
+
+
+class PairedDatasetLoader:
+    """
+    把文件夹中的图片与对话文件中的对话组配对后按顺序输出，配对只计算一次，
+    图片与对话始终对齐。图片在后台预取，大文件的对话组也一并提前读取。
+    """
+
+    def __init__(self):
+        self.prefetcher = ImagePrefetcher()
+        # (组序号, future)：大文件和压缩文件的下一批对话组
+        self._text_prefetch = None
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "folder_path": ("STRING", {"default": "", "multiline": False}),
+                "file_path": ("STRING", {"default": "", "multiline": False}),
+                # stem: 文件名（不含扩展名）对应组标题或组序号；index: 第 i 张图片对应第 i 组；mapping: 按映射文件
+                "join_mode": (JOIN_MODES, {"default": "stem"}),
+                "mode": (["fixed", "increment", "decrement", "random"], {"default": "increment"}),
+                "index": ("INT", {"default": 0, "min": 0, "max": 99999}),
+                "extensions": ("STRING", {"default": "png,jpg,jpeg,webp,bmp,tiff,gif", "multiline": False}),
+                "load_mode": (LOAD_MODES, {"default": "by_line"}),
+                "custom_separator": ("STRING", {"default": "---", "multiline": False}),
+            },
+            "optional": {
+                "mapping_path": ("STRING", {"default": "", "multiline": False}),
+                "prefetch": ("INT", {"default": 4, "min": 0, "max": 64}),
+                "batch_size": ("INT", {"default": 1, "min": 1, "max": 4096}),
+                "size_policy": (SIZE_POLICIES, {"default": "resize"}),
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8}),
+                "recursive": ("BOOLEAN", {"default": False}),
+                "include": ("STRING", {"default": "", "multiline": False}),
+                "exclude": ("STRING", {"default": "", "multiline": False}),
+                # random 模式的打乱种子
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            }
+        }
+
+    # 单个输出为批次中的第一对；后四个输出逐对列出整个批次
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING", "STRING", "STRING", "INT", "INT", "STRING",
+                    "IMAGE", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("image", "title", "content", "full_group", "filename", "current_index", "total_count",
+                    "report", "image_list", "titles", "contents", "filenames")
+    OUTPUT_IS_LIST = (False, False, False, False, False, False, False, False, True, True, True, True)
+    FUNCTION = "load_pair"
+    CATEGORY = "dialogue_extractor"
+
+    @classmethod
+    def IS_CHANGED(cls, folder_path, file_path, join_mode, mode, index, extensions, load_mode,
+                   custom_separator, batch_size=1, **kwargs):
+        if mode in ["increment", "decrement", "random"]:
+            return float("NaN")
+        # fixed 模式：选中的图片、对话文件或映射文件变化时才重新执行
+        folder_path = folder_path.strip()
+        mapping_path = kwargs.get("mapping_path", "").strip()
+        try:
+            join = cls.get_join(folder_path, file_path.strip(), join_mode, extensions, load_mode,
+                                custom_separator, mapping_path, kwargs.get("recursive", False),
+                                kwargs.get("include", ""), kwargs.get("exclude", ""))
+        except (OSError, ValueError):
+            return folder_fingerprint(folder_path)
+        if not join.images:
+            return folder_fingerprint(folder_path)
+        positions = [(index + i) % len(join.images) for i in range(batch_size)]
+        fingerprints = [file_fingerprint(os.path.join(folder_path, join.images[p])) for p in positions]
+        if join_mode == "mapping":
+            fingerprints.insert(0, file_fingerprint(mapping_path))
+        return "|".join([file_fingerprint(file_path.strip())] + fingerprints)
+
+    @staticmethod
+    def get_join(folder_path, file_path, join_mode, extensions, load_mode, custom_separator,
+                 mapping_path="", recursive=False, include="", exclude=""):
+        if not folder_path:
+            raise ValueError("Folder path cannot be empty")
+        if not os.path.exists(folder_path):
+            raise ValueError(f"Folder path does not exist: {folder_path}")
+        if not os.path.isfile(file_path):
+            raise ValueError(f"Dialogue file does not exist: {file_path}")
+        if join_mode == "mapping" and not os.path.isfile(mapping_path):
+            raise ValueError(f"Mapping file does not exist: {mapping_path}")
+        image_files = IMAGE_LIST_CACHE.get(folder_path, extensions, recursive, include, exclude)
+        return get_join(image_files, folder_path, file_path, load_mode, custom_separator, join_mode, mapping_path)
+
+    def fetch_text(self, file_path, load_mode, custom_separator, group_indices):
+        prefetched, self._text_prefetch = self._text_prefetch, None
+        if prefetched is not None and prefetched[0] == (file_path, load_mode, custom_separator, tuple(group_indices)):
+            try:
+                return prefetched[1].result()
+            except Exception:
+                pass
+        return fetch_groups(file_path, load_mode, custom_separator, group_indices)
+
+    def load_pair(self, folder_path: str, file_path: str, join_mode: str, mode: str, index: int, extensions: str,
+                  load_mode: str = "by_line", custom_separator: str = "---", mapping_path: str = "",
+                  prefetch: int = 4, batch_size: int = 1, size_policy: str = "resize", max_side: int = 0,
+                  recursive: bool = False, include: str = "", exclude: str = "", seed: int = 0, unique_id=None):
+        folder_path, file_path, mapping_path = folder_path.strip(), file_path.strip(), mapping_path.strip()
+        join = self.get_join(folder_path, file_path, join_mode, extensions, load_mode, custom_separator,
+                             mapping_path, recursive, include, exclude)
+        total_count = len(join.images)
+        if not total_count:
+            raise ValueError(f"No image/dialogue pairs found:\n{join.report}")
+
+        if mode == "fixed":
+            positions = [index + i for i in range(batch_size)]
+        else:
+            # 计数器与 Sequential Image Loader 共用持久化存储，按节点 id 区分
+            counter = CURSOR_STORE.advance(
+                cursor_key(folder_path, extensions, unique_id), os.path.abspath(folder_path),
+                extensions, str(unique_id), batch_size)
+            if mode == "decrement":
+                positions = [index - counter - i for i in range(batch_size)]
+            else:
+                positions = [index + counter + i for i in range(batch_size)]
+
+        order_seed = seed if mode == "random" else None
+        pair_indices = [shard_index(total_count, 0, 1, p, order_seed) for p in positions]
+        selected_files = [join.images[i] for i in pair_indices]
+        group_indices = [join.groups[i] for i in pair_indices]
+        file_paths = [os.path.join(folder_path, f) for f in selected_files]
+        filenames = [Path(f).stem for f in selected_files]
+
+        decode = functools.partial(load_image_tensor, max_side=max_side)
+        if mode == "fixed":
+            decode = functools.partial(IMAGE_CACHE.get, mode=f"auto:{max_side}", decode=decode)
+        images = self.prefetcher.take_many(file_paths, decode)
+        image_tensor, image_list = stack_images(images, size_policy)
+        texts = self.fetch_text(file_path, load_mode, custom_separator, group_indices)
+        titles = [t[0] for t in texts]
+        contents = [t[1] for t in texts]
+
+        if mode != "fixed" and prefetch > 0:
+            # 图片和对话组按同一顺序预取：图片预取 prefetch 张，对话组预取下一个批次
+            step = -1 if mode == "decrement" else 1
+            def upcoming(count):
+                return [shard_index(total_count, 0, 1, index + step * (counter + ahead), order_seed)
+                        for ahead in range(batch_size, batch_size + min(count, total_count))]
+            self.prefetcher.schedule((folder_path, extensions, mode, max_side),
+                                     [os.path.join(folder_path, join.images[i]) for i in upcoming(prefetch)], decode)
+            if needs_offset_index(file_path):
+                next_groups = [join.groups[i] for i in upcoming(batch_size)]
+                self._text_prefetch = ((file_path, load_mode, custom_separator, tuple(next_groups)), get_executor().submit(
+                    fetch_groups, file_path, load_mode, custom_separator, next_groups))
+        else:
+            self.prefetcher.cancel()
+            self._text_prefetch = None
+
+        return (image_tensor, titles[0], contents[0], texts[0][2], filenames[0], pair_indices[0], total_count,
+                join.report, image_list, titles, contents, filenames)
+
+
+NODE_CLASS_MAPPINGS = {
+    "PairedDatasetLoader": PairedDatasetLoader,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "PairedDatasetLoader": "Paired Dataset Loader",
+}
@@ -0,0 +1,172 @@
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from contextlib import closing
+
+from .dialogue_groups import file_signature, parse_group, scan_key
+from .offset_index import index_path_for, iter_groups
+
+SEARCH_INDEX_VERSION = 1
+# Posting entries buffered in memory before they are flushed to sqlite
+FLUSH_POSTINGS = 2000000
+
+# CJK text has no word breaks, so every CJK character is its own token; other
+# scripts are split into runs of letters and digits
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+TOKEN_RE = re.compile(rf'[{CJK_CHARS}]|[^\W_{CJK_CHARS}]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+class SearchIndex:
+    """
+    Persistent inverted index of one dialogue file: word tokens and speaker
+    titles mapped to group indices, stored in sqlite next to the offset index
+    and rebuilt whenever the file's mtime or size changes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def connect(self):
+        return closing(sqlite3.connect(self.db_path))
+
+    def tokens(self, token_list):
+        """
+        Sorted indices of candidate groups for a set of tokens. Postings are
+        intersected starting from the rarest token; tokens far more common than
+        the current candidates are skipped, since callers verify every match
+        against the group text anyway.
+        """
+        with self.connect() as conn:
+            frequencies = []
+            for token in set(token_list):
+                row = conn.execute("SELECT df FROM tokens WHERE token = ?", (token,)).fetchone()
+                if row is None:
+                    return []
+                frequencies.append((row[0], token))
+            frequencies.sort()
+            result = None
+            for df, token in frequencies:
+                if result is not None and df > 4 * len(result):
+                    break
+                ids = self._postings(conn, token)
+                result = ids if result is None else sorted(set(result).intersection(ids))
+                if not result:
+                    return []
+        return list(result or ())
+
+    @staticmethod
+    def _postings(conn, token):
+        ids = array('I')
+        for (blob,) in conn.execute("SELECT ids FROM postings WHERE token = ? ORDER BY first_group", (token,)):
+            ids.frombytes(blob)
+        return ids
+
+    def speaker(self, name):
+        with self.connect() as conn:
+            rows = conn.execute("SELECT group_id FROM speakers WHERE speaker = ? ORDER BY group_id",
+                                (name.strip().casefold(),))
+            return [row[0] for row in rows]
+
+    def speakers(self):
+        """Every speaker with the number of groups they appear as the title of."""
+        with self.connect() as conn:
+            rows = conn.execute("SELECT speaker, COUNT(*) FROM speakers GROUP BY speaker ORDER BY speaker")
+            return rows.fetchall()
+
+    @classmethod
+    def build(cls, file_path, db_path, load_mode, custom_separator, signature):
+        tmp_path = f"{db_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript("""
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE tokens (token TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID;
+                CREATE TABLE postings (token TEXT, first_group INTEGER, ids BLOB, PRIMARY KEY (token, first_group)) WITHOUT ROWID;
+                CREATE TABLE speakers (speaker TEXT, group_id INTEGER, PRIMARY KEY (speaker, group_id)) WITHOUT ROWID;
+            """)
+            # Postings are buffered per token and written as packed uint32 blobs
+            buffered = {}
+            buffered_count = 0
+            frequencies = {}
+            speakers = []
+            for i, group in enumerate(iter_groups(file_path, load_mode, custom_separator)):
+                tokens = set(tokenize(group))
+                for token in tokens:
+                    ids = buffered.get(token)
+                    if ids is None:
+                        ids = buffered[token] = array('I')
+                    ids.append(i)
+                buffered_count += len(tokens)
+                title, _, has_title = parse_group(group, i, load_mode)
+                if has_title:
+                    speakers.append((title.strip().casefold(), i))
+                if buffered_count >= FLUSH_POSTINGS:
+                    cls._flush(conn, buffered, frequencies, speakers)
+                    buffered_count = 0
+            cls._flush(conn, buffered, frequencies, speakers)
+            conn.executemany("INSERT INTO tokens VALUES (?, ?)", frequencies.items())
+            path, mtime_ns, size = signature
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("version", str(SEARCH_INDEX_VERSION)),
+                ("source_path", path),
+                ("source_mtime_ns", str(mtime_ns)),
+                ("source_size", str(size)),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, db_path)
+        return cls(db_path)
+
+    @staticmethod
+    def _flush(conn, buffered, frequencies, speakers):
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                         ((token, ids[0], ids.tobytes()) for token, ids in buffered.items()))
+        for token, ids in buffered.items():
+            frequencies[token] = frequencies.get(token, 0) + len(ids)
+        conn.executemany("INSERT INTO speakers VALUES (?, ?)", speakers)
+        buffered.clear()
+        speakers.clear()
+
+    @classmethod
+    def open_current(cls, db_path, signature):
+        """The existing index if it was built from exactly this version of the file."""
+        if not os.path.exists(db_path):
+            return None
+        try:
+            with closing(sqlite3.connect(db_path)) as conn:
+                meta = dict(conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            return None
+        path, mtime_ns, size = signature
+        if meta.get("version") != str(SEARCH_INDEX_VERSION) or meta.get("source_path") != path \
+                or meta.get("source_mtime_ns") != str(mtime_ns) or meta.get("source_size") != str(size):
+            return None
+        return cls(db_path)
+
+
+_search_lock = threading.Lock()
+
+
+def get_search_index(file_path, load_mode, custom_separator="---"):
+    """Return an up-to-date SearchIndex for the file, building it if needed."""
+    _, separator = scan_key(load_mode, custom_separator)
+    # Speaker titles depend on the requested mode, not just how groups are split
+    db_path = index_path_for(file_path, load_mode, separator, suffix=".search.sqlite")
+    signature = file_signature(file_path)
+    with _search_lock:
+        index = SearchIndex.open_current(db_path, signature)
+        if index is None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            index = SearchIndex.build(file_path, db_path, load_mode, separator, signature)
+        return index
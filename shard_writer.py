@@ -0,0 +1,224 @@
+import atexit
+import io
+import os
+import sqlite3
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+from contextlib import closing
+
+OUTPUT_MODES = ["files", "tar", "zip"]
+# Default cap on one shard's size before a new shard is started
+DEFAULT_SHARD_MB = 1024
+ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+def shard_file_name(prefix, number, archive_format):
+    return f"{prefix}-{number:06d}.{archive_format}"
+
+
+def index_file_name(prefix, archive_format):
+    # One index per format, so tar and zip shards sharing a prefix never see each other's keys
+    return f"{prefix}.{archive_format}.index.sqlite"
+
+
+def glob_escape(text):
+    return "".join(f"[{c}]" if c in "*?[" else c for c in text)
+
+
+class ShardWriter:
+    """
+    Appends members named <key>.<ext> to rolling tar or zip shards named
+    <prefix>-000000.tar, ... Every member is recorded in <prefix>.<format>.index.sqlite
+    next to the shards with its shard, data offset and size, so read_sample()
+    seeks straight to it. Zip members are stored uncompressed for the same reason.
+
+    The members passed to one write() call form a sample: they go into the same
+    shard one after another, as WebDataset expects (an image saver's caption).
+    Members written by separate calls (an image batch, then TextSaver texts) are
+    only paired through the index by read_sample(). A key whose extension is
+    already indexed gets a _1, _2, ... suffix instead of a second member with
+    the same name.
+
+    Savers close() the writer after each execution, which finalizes the archive
+    (a zip gets its central directory). The shards table records the size of
+    each finalized shard; a shard is appended to again only while it still has
+    exactly that size, so one left unfinished by a crash is never reopened.
+    """
+
+    def __init__(self, directory, prefix, archive_format, max_shard_bytes):
+        self.directory = directory
+        self.prefix = prefix
+        self.archive_format = archive_format
+        self.max_shard_bytes = max_shard_bytes
+        self._lock = threading.Lock()
+        self._archive = None
+        self._shard_number = None
+        self._shard_path = None
+        self._index = sqlite3.connect(os.path.join(directory, index_file_name(prefix, archive_format)),
+                                      check_same_thread=False)
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS members (
+                key TEXT,
+                extension TEXT,
+                shard TEXT,
+                offset INTEGER,
+                size INTEGER,
+                PRIMARY KEY (key, extension)
+            )
+        """)
+        # closed_size is NULL while a shard is open for writing
+        self._index.execute("CREATE TABLE IF NOT EXISTS shards (number INTEGER PRIMARY KEY, name TEXT, "
+                            "closed_size INTEGER)")
+
+    def write(self, key, members):
+        """Append {extension: bytes} under key; returns the shard's path and the key actually used."""
+        # Headers and padding add roughly a kilobyte per member
+        sample_bytes = sum(len(data) + 1024 for data in members.values())
+        with self._lock:
+            key = self._unique_key(key, members)
+            self._open_for(sample_bytes)
+            rows = []
+            for extension, data in members.items():
+                offset = self._add_member(f"{key}.{extension}", data)
+                rows.append((key, extension, os.path.basename(self._shard_path), offset, len(data)))
+            self._flush_archive()
+            with self._index:
+                self._index.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?)", rows)
+            return self._shard_path, key
+
+    def next_counter(self, base):
+        """Next NNNN after every indexed key named base_NNNN, for savers that number their files."""
+        with self._lock:
+            rows = self._index.execute("SELECT DISTINCT key FROM members WHERE key GLOB ?",
+                                       (glob_escape(base) + "_[0-9][0-9][0-9][0-9]*",)).fetchall()
+        counters = [int(key[len(base) + 1:]) for key, in rows if key[len(base) + 1:].isdigit()]
+        return max(counters) + 1 if counters else 0
+
+    def _unique_key(self, key, members):
+        def taken(candidate):
+            return any(self._index.execute("SELECT 1 FROM members WHERE key = ? AND extension = ?",
+                                           (candidate, extension)).fetchone()
+                       for extension in members)
+
+        candidate, n = key, 0
+        while taken(candidate):
+            n += 1
+            candidate = f"{key}_{n}"
+        return candidate
+
+    def _open_for(self, sample_bytes):
+        if self._archive is not None:
+            size = os.path.getsize(self._shard_path)
+            if size == 0 or size + sample_bytes <= self.max_shard_bytes:
+                return
+            self._close_archive()
+            self._shard_number += 1
+        elif self._shard_number is None:
+            row = self._index.execute("SELECT MAX(number) FROM shards").fetchone()
+            self._shard_number = row[0] if row[0] is not None else 0
+
+        while True:
+            name = shard_file_name(self.prefix, self._shard_number, self.archive_format)
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                self._archive = self._open_archive(path, False)
+                break
+            size = os.path.getsize(path)
+            row = self._index.execute("SELECT closed_size FROM shards WHERE number = ?",
+                                      (self._shard_number,)).fetchone()
+            # A shard left unfinished by a crash is kept for its indexed members, but never appended to
+            if row is not None and row[0] == size and size + sample_bytes <= self.max_shard_bytes:
+                try:
+                    self._archive = self._open_archive(path, True)
+                    break
+                except (tarfile.TarError, zipfile.BadZipFile):
+                    pass
+            self._shard_number += 1
+        self._shard_path = path
+        with self._index:
+            self._index.execute("INSERT OR REPLACE INTO shards VALUES (?, ?, NULL)", (self._shard_number, name))
+
+    def _open_archive(self, path, exists):
+        if self.archive_format == "tar":
+            return tarfile.open(path, "a" if exists else "w", format=tarfile.PAX_FORMAT)
+        return zipfile.ZipFile(path, "a" if exists else "w", compression=zipfile.ZIP_STORED)
+
+    def _add_member(self, name, data):
+        """Write one member and return the offset of its data in the shard."""
+        if self.archive_format == "tar":
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._archive.addfile(info, io.BytesIO(data))
+            # addfile works on a copy of info; the data ends the member, padded to whole blocks
+            blocks = -(-len(data) // tarfile.BLOCKSIZE)
+            return self._archive.offset - blocks * tarfile.BLOCKSIZE
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        self._archive.writestr(info, data)
+        return info.header_offset
+
+    def _flush_archive(self):
+        fileobj = self._archive.fileobj if self.archive_format == "tar" else self._archive.fp
+        fileobj.flush()
+
+    def _close_archive(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+            with self._index:
+                self._index.execute("UPDATE shards SET closed_size = ? WHERE number = ?",
+                                    (os.path.getsize(self._shard_path), self._shard_number))
+
+    def close(self):
+        """Finalize the open shard; the next write() reopens it for appending."""
+        with self._lock:
+            self._close_archive()
+
+
+_writers_lock = threading.Lock()
+_writers = {}
+
+
+def get_shard_writer(directory, prefix, archive_format, max_shard_mb=DEFAULT_SHARD_MB):
+    """Writers and their index connections are kept between executions; callers close() the archive."""
+    key = (os.path.abspath(directory), prefix, archive_format)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            os.makedirs(key[0], exist_ok=True)
+            writer = ShardWriter(key[0], prefix, archive_format, max_shard_mb * 1024 * 1024)
+            _writers[key] = writer
+        writer.max_shard_bytes = max_shard_mb * 1024 * 1024
+        return writer
+
+
+def close_shard_writers():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+
+
+atexit.register(close_shard_writers)
+
+
+def read_sample(directory, prefix, key, archive_format):
+    """{extension: bytes} for one sample, read via the index without scanning shards."""
+    index_path = os.path.join(directory, index_file_name(prefix, archive_format))
+    with closing(sqlite3.connect(index_path)) as conn:
+        rows = conn.execute("SELECT extension, shard, offset, size FROM members WHERE key = ?",
+                            (key,)).fetchall()
+    sample = {}
+    for extension, shard, offset, size in rows:
+        with open(os.path.join(directory, shard), "rb") as f:
+            if shard.endswith(".zip"):
+                # offset is the member's local header; the data follows its name and extra field
+                f.seek(offset)
+                header = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+                f.seek(header[-2] + header[-1], os.SEEK_CUR)
+            else:
+                f.seek(offset)
+            sample[extension] = f.read(size)
+    return sample
@@ -1,5 +1,9 @@
 import os
-import re
+
+from .dialogue_groups import GROUP_CACHE, listing_title, parse_group
+from .fingerprint import file_fingerprint
+from .offset_index import fetch_groups, get_offset_index, group_count, needs_offset_index
+from .search_index import get_search_index, tokenize
 
 class TextLoad:
     @classmethod
@@ -31,77 +35,42 @@ class TextLoad:
     FUNCTION = "extract_dialogue"
     CATEGORY = "utils"
 
+    @classmethod
+    def IS_CHANGED(cls, file_path, **kwargs):
+        # Other inputs are already part of ComfyUI's cache key; only the file can change underneath
+        return file_fingerprint(file_path)
+
     def extract_dialogue(self, file_path, group_index, load_mode="by_line", custom_separator="---"):
         if not os.path.exists(file_path):
             return ("File not found", "File not found", "File not found")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            if needs_offset_index(file_path):
+                # Huge or compressed files: look up the group's byte span and decode only that slice
+                index = get_offset_index(file_path, load_mode, custom_separator)
+                
+                if not index.count:
+                    return ("No groups found", "No groups found", "No groups found")
+                
+                if group_index >= index.count:
+                    return (f"Group index {group_index} out of range (max: {index.count-1})", 
+                           f"Group index {group_index} out of range (max: {index.count-1})", 
+                           f"Group index {group_index} out of range (max: {index.count-1})")
+                
+                return index.parsed_group(file_path, group_index, load_mode)
             
-            # Split content based on load mode
-            if load_mode == "by_line":
-                # Each line is a separate group
-                groups = [line for line in content.strip().split('\n') if line.strip()]
-            elif load_mode == "by_double_newline":
-                # Split by double newline (original behavior)
-                groups = content.strip().split('\n\n')
-            elif load_mode == "by_custom_separator":
-                # Split by custom separator
-                groups = content.strip().split(custom_separator)
-                # Clean up groups (remove empty ones and strip whitespace)
-                groups = [g.strip() for g in groups if g.strip()]
-            else:
-                # Default to by_line if mode is unrecognized
-                groups = [line for line in content.strip().split('\n') if line.strip()]
+            # Parsed once per file version and shared across executions
+            parsed = GROUP_CACHE.get(file_path, load_mode, custom_separator)
             
-            if not groups:
+            if not len(parsed):
                 return ("No groups found", "No groups found", "No groups found")
             
-            if group_index >= len(groups):
-                return (f"Group index {group_index} out of range (max: {len(groups)-1})", 
-                       f"Group index {group_index} out of range (max: {len(groups)-1})", 
-                       f"Group index {group_index} out of range (max: {len(groups)-1})")
-            
-            selected_group = groups[group_index]
-            
-            # Process selected group based on mode
-            if load_mode == "by_line":
-                # For single line mode, the whole line is the content
-                # Check if it has a title in brackets
-                title_match = re.match(r'\[([^\]]+)\]\s*(.*)', selected_group)
-                if title_match:
-                    title = title_match.group(1)
-                    content = title_match.group(2) if title_match.group(2) else selected_group
-                else:
-                    # No title, use first part as title
-                    parts = selected_group.split(':', 1)
-                    if len(parts) > 1:
-                        title = parts[0].strip()
-                        content = parts[1].strip()
-                    else:
-                        title = f"Line {group_index}"
-                        content = selected_group
-                full_group = selected_group
-            else:
-                # For multi-line modes (double newline or custom separator)
-                lines = selected_group.strip().split('\n')
-                
-                if not lines:
-                    return ("Empty group", "Empty group", "Empty group")
-                
-                title_match = re.match(r'\[([^\]]+)\]', lines[0])
-                title = title_match.group(1) if title_match else lines[0]
-                
-                content_lines = []
-                for line in lines:
-                    if not re.match(r'^\[.*\]$', line):
-                        content_lines.append(line)
-                
-                content = '\n'.join(content_lines)
-                full_group = selected_group
+            if group_index >= len(parsed):
+                return (f"Group index {group_index} out of range (max: {len(parsed)-1})", 
+                       f"Group index {group_index} out of range (max: {len(parsed)-1})", 
+                       f"Group index {group_index} out of range (max: {len(parsed)-1})")
             
-            return (title, content, full_group)
+            return (parsed.titles[group_index], parsed.contents[group_index], parsed.groups[group_index])
         
         except Exception as e:
             error_msg = f"Error reading file: {str(e)}"
@@ -124,6 +93,20 @@ class TextLoadCounter:
                     "default": "---",
                     "multiline": False
                 })
+            },
+            "optional": {
+                "titles_offset": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 99999999,
+                    "step": 1
+                }),
+                "max_titles": ("INT", {
+                    "default": 1000,
+                    "min": 0,
+                    "max": 1000000,
+                    "step": 1
+                })
             }
         }
 
@@ -132,68 +115,217 @@ class TextLoadCounter:
     FUNCTION = "count_groups"
     CATEGORY = "utils"
 
-    def count_groups(self, file_path, load_mode="by_line", custom_separator="---"):
+    @classmethod
+    def IS_CHANGED(cls, file_path, **kwargs):
+        return file_fingerprint(file_path)
+
+    def count_groups(self, file_path, load_mode="by_line", custom_separator="---",
+                     titles_offset=0, max_titles=1000):
         if not os.path.exists(file_path):
             return (0, "File not found")
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Split content based on load mode
-            if load_mode == "by_line":
-                # Each line is a separate group
-                groups = [line for line in content.strip().split('\n') if line.strip()]
-            elif load_mode == "by_double_newline":
-                # Split by double newline
-                groups = content.strip().split('\n\n')
-            elif load_mode == "by_custom_separator":
-                # Split by custom separator
-                groups = content.strip().split(custom_separator)
-                # Clean up groups (remove empty ones and strip whitespace)
-                groups = [g.strip() for g in groups if g.strip()]
+            # Only one page of titles is built; max_titles=0 lists every group
+            if needs_offset_index(file_path):
+                # Streams the file once to build the offset index, then decodes
+                # just the groups on the requested page
+                index = get_offset_index(file_path, load_mode, custom_separator)
+                total = index.count
+                page_end = total if max_titles == 0 else min(total, titles_offset + max_titles)
+                page = range(titles_offset, page_end)
+                titles = []
+                for i, group in zip(page, index.groups(file_path, page)):
+                    title, _, has_title = parse_group(group, i, load_mode)
+                    titles.append(f"{i}: {listing_title(title, has_title, i, load_mode)}")
             else:
-                # Default to by_line if mode is unrecognized
-                groups = [line for line in content.strip().split('\n') if line.strip()]
+                parsed = GROUP_CACHE.get(file_path, load_mode, custom_separator)
+                total = len(parsed)
+                page_end = total if max_titles == 0 else min(total, titles_offset + max_titles)
+                titles = []
+                for i in range(titles_offset, page_end):
+                    title = listing_title(parsed.titles[i], i not in parsed.untitled, i, load_mode)
+                    titles.append(f"{i}: {title}")
             
-            titles = []
+            if page_end < total:
+                titles.append(f"... {total - page_end} more (set titles_offset to {page_end} for the next page)")
             
-            for i, group in enumerate(groups):
-                if load_mode == "by_line":
-                    # For single line mode, extract title from the line
-                    title_match = re.match(r'\[([^\]]+)\]\s*(.*)', group)
-                    if title_match:
-                        title = title_match.group(1)
-                    else:
-                        # Check for colon-separated title
-                        parts = group.split(':', 1)
-                        if len(parts) > 1:
-                            title = parts[0].strip()
-                        else:
-                            title = f"Line {i}"
-                else:
-                    # For multi-line modes
-                    lines = group.strip().split('\n')
-                    if lines:
-                        title_match = re.match(r'\[([^\]]+)\]', lines[0])
-                        title = title_match.group(1) if title_match else f"Group {i}"
-                    else:
-                        title = f"Group {i}"
-                
-                titles.append(f"{i}: {title}")
-            
-            return (len(groups), '\n'.join(titles))
+            return (total, '\n'.join(titles))
         
         except Exception as e:
             return (0, f"Error reading file: {str(e)}")
 
 
+class TextLoadBatch:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "file_path": ("STRING", {
+                    "default": r"D:\江江\kiro\comfyui\dialogues-export-2025-08-17-with-name.txt",
+                    "multiline": False
+                }),
+                "start_index": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 999999,
+                    "step": 1
+                }),
+                "count": ("INT", {
+                    "default": 16,
+                    "min": 1,
+                    "max": 4096,
+                    "step": 1
+                }),
+                "stride": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 9999,
+                    "step": 1
+                }),
+                "load_mode": (["by_line", "by_double_newline", "by_custom_separator"], {
+                    "default": "by_line"
+                }),
+                "custom_separator": ("STRING", {
+                    "default": "---",
+                    "multiline": False
+                })
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "INT")
+    RETURN_NAMES = ("titles", "contents", "full_groups", "group_indices")
+    OUTPUT_IS_LIST = (True, True, True, True)
+    FUNCTION = "extract_batch"
+    CATEGORY = "utils"
+
+    @classmethod
+    def IS_CHANGED(cls, file_path, **kwargs):
+        return file_fingerprint(file_path)
+
+    def extract_batch(self, file_path, start_index, count, stride, load_mode="by_line", custom_separator="---"):
+        if not os.path.exists(file_path):
+            return (["File not found"], ["File not found"], ["File not found"], [-1])
+        
+        try:
+            total = group_count(file_path, load_mode, custom_separator)
+            
+            if not total:
+                return (["No groups found"], ["No groups found"], ["No groups found"], [-1])
+            
+            # Indices past the end are dropped, so the last batch may be shorter
+            group_indices = list(range(start_index, min(total, start_index + count * stride), stride))
+            if not group_indices:
+                error_msg = f"Group index {start_index} out of range (max: {total-1})"
+                return ([error_msg], [error_msg], [error_msg], [-1])
+            
+            results = fetch_groups(file_path, load_mode, custom_separator, group_indices)
+            titles = [r[0] for r in results]
+            contents = [r[1] for r in results]
+            full_groups = [r[2] for r in results]
+            
+            return (titles, contents, full_groups, group_indices)
+        
+        except Exception as e:
+            error_msg = f"Error reading file: {str(e)}"
+            return ([error_msg], [error_msg], [error_msg], [-1])
+
+
+class TextSearch:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "file_path": ("STRING", {
+                    "default": r"D:\江江\kiro\comfyui\dialogues-export-2025-08-17-with-name.txt",
+                    "multiline": False
+                }),
+                "keyword": ("STRING", {
+                    "default": "",
+                    "multiline": False
+                }),
+                "speaker": ("STRING", {
+                    "default": "",
+                    "multiline": False
+                }),
+                "load_mode": (["by_line", "by_double_newline", "by_custom_separator"], {
+                    "default": "by_line"
+                }),
+                "custom_separator": ("STRING", {
+                    "default": "---",
+                    "multiline": False
+                }),
+                "max_results": ("INT", {
+                    "default": 100,
+                    "min": 1,
+                    "max": 10000,
+                    "step": 1
+                })
+            }
+        }
+
+    RETURN_TYPES = ("INT", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("group_indices", "titles", "contents", "full_groups")
+    OUTPUT_IS_LIST = (True, True, True, True)
+    FUNCTION = "search"
+    CATEGORY = "utils"
+
+    @classmethod
+    def IS_CHANGED(cls, file_path, **kwargs):
+        return file_fingerprint(file_path)
+
+    def search(self, file_path, keyword, speaker, load_mode="by_line", custom_separator="---", max_results=100):
+        if not os.path.exists(file_path):
+            return ([-1], ["File not found"], ["File not found"], ["File not found"])
+        
+        keyword = keyword.strip()
+        speaker = speaker.strip()
+        if not keyword and not speaker:
+            return ([-1], ["No keyword or speaker given"], ["No keyword or speaker given"], ["No keyword or speaker given"])
+        
+        try:
+            index = get_search_index(file_path, load_mode, custom_separator)
+            
+            # Candidates come from the index; keywords are whole words (or single
+            # CJK characters), and the exact phrase is confirmed on the group text
+            candidates = None
+            if speaker:
+                candidates = index.speaker(speaker)
+            if keyword:
+                tokens = tokenize(keyword)
+                keyword_hits = index.tokens(tokens) if tokens else range(group_count(file_path, load_mode, custom_separator))
+                candidates = keyword_hits if candidates is None else sorted(set(candidates) & set(keyword_hits))
+            
+            needle = keyword.casefold()
+            matches = []
+            for batch_start in range(0, len(candidates), 256):
+                batch = list(candidates[batch_start:batch_start + 256])
+                for i, group in zip(batch, fetch_groups(file_path, load_mode, custom_separator, batch)):
+                    if needle in group[2].casefold():
+                        matches.append((i,) + group)
+                if len(matches) >= max_results:
+                    break
+            matches = matches[:max_results]
+            
+            if not matches:
+                return ([-1], ["No matches found"], ["No matches found"], ["No matches found"])
+            
+            return ([m[0] for m in matches], [m[1] for m in matches], [m[2] for m in matches], [m[3] for m in matches])
+        
+        except Exception as e:
+            error_msg = f"Error searching file: {str(e)}"
+            return ([-1], [error_msg], [error_msg], [error_msg])
+
+
 NODE_CLASS_MAPPINGS = {
     "TextLoad": TextLoad,
-    "TextLoadCounter": TextLoadCounter
+    "TextLoadCounter": TextLoadCounter,
+    "TextLoadBatch": TextLoadBatch,
+    "TextSearch": TextSearch
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "TextLoad": "Text Load",
-    "TextLoadCounter": "Text Load Counter"
+    "TextLoadCounter": "Text Load Counter",
+    "TextLoadBatch": "Text Load Batch",
+    "TextSearch": "Text Search"
 }
\ No newline at end of file
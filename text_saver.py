@@ -2,6 +2,8 @@ import os
 import folder_paths
 from datetime import datetime
 
+from .shard_writer import DEFAULT_SHARD_MB, OUTPUT_MODES, get_shard_writer
+
 class TextSaver:
     @classmethod
     def INPUT_TYPES(cls):
@@ -35,6 +37,25 @@ class TextSaver:
                     "default": "\n\n",
                     "multiline": False
                 })
+            },
+            "optional": {
+                # tar/zip append each text as <filename>.txt to rolling shards. Texts and images
+                # saved under the same key are paired only through the shard index (read_sample);
+                # pass captions to the image saver to store them next to their images.
+                # A key already saved gets a _1, _2 suffix
+                "output_mode": (OUTPUT_MODES, {
+                    "default": "files"
+                }),
+                "shard_name": ("STRING", {
+                    "default": "shard",
+                    "multiline": False
+                }),
+                "max_shard_mb": ("INT", {
+                    "default": DEFAULT_SHARD_MB,
+                    "min": 1,
+                    "max": 65536,
+                    "step": 1
+                })
             }
         }
 
@@ -45,7 +66,8 @@ class TextSaver:
     CATEGORY = "text/io"
 
     def save_text(self, text, filename, save_path, add_timestamp, write_mode, 
-                 add_spacing, spacing_type, custom_separator):
+                 add_spacing, spacing_type, custom_separator, output_mode="files",
+                 shard_name="shard", max_shard_mb=DEFAULT_SHARD_MB):
         
         output_dir = folder_paths.get_output_directory()
         
@@ -67,6 +89,20 @@ class TextSaver:
         full_filename = f"{base_filename}.txt"
         full_path = os.path.join(full_output_dir, full_filename)
         
+        if output_mode != "files":
+            # Each archive member is its own sample, so spacing and append do not apply
+            try:
+                writer = get_shard_writer(full_output_dir, shard_name, output_mode, max_shard_mb)
+                try:
+                    shard_path, key = writer.write(base_filename, {"txt": text.encode('utf-8')})
+                finally:
+                    # Finalize the shard so it is a readable archive between executions
+                    writer.close()
+                return (f"{shard_path}/{key}.txt", text)
+            except Exception as e:
+                error_msg = f"Error saving file: {str(e)}"
+                return (error_msg, error_msg)
+        
         content_to_write = text
         
         if add_spacing and content_to_write.strip():